@@ -0,0 +1,134 @@
+"""
+Background clock synchronisation for LSL streams. Time corrections of an inlet
+and the offset between unix time and the local LSL clock are measured
+periodically, and a linear model (offset + drift) is fitted to recent
+measurements, so timestamps can be converted with a vectorized transform
+instead of a call per sample.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+import pylsl
+
+
+class ClockSync:
+
+    def __init__(self, inlet=None, interval=5., window=24):
+        """
+        Initializes clock synchronisation
+
+        :param inlet: LSL inlet whose time corrections are measured. If None,
+                      only the unix <-> LSL offset is measured.
+        :param interval: number of seconds between measurements
+        :param window: number of recent measurements the models are fitted to
+        """
+        self.inlet = inlet
+        self.interval = interval
+
+        self._measurements = collections.deque(maxlen=window)
+
+        # (reference time, offset, drift) for the inlet time correction and
+        # for unix time - local LSL time. Models are replaced, never mutated,
+        # so readers in other threads always see a consistent model.
+        self._correction_model = (0., 0., 0.)
+        self._unix_model = (0., time.time() - pylsl.local_clock(), 0.)
+
+        self._thread = None
+        self._stopped = threading.Event()
+
+    #
+    # Measuring
+    #
+
+    def start(self):
+        """Start measuring in a background thread"""
+        if self._thread is not None:
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._measure_indefinitely,
+                                        name='clock sync')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop measuring"""
+        self._stopped.set()
+        self._thread = None
+
+    def _measure_indefinitely(self):
+        """Measures clock offsets every interval seconds"""
+        while not self._stopped.wait(self.interval):
+            self.measure()
+
+    def measure(self):
+        """Takes one measurement and refits the models"""
+        correction = self.inlet.time_correction() if self.inlet else 0.
+
+        # bracket the unix clock reading with two LSL clock readings
+        before = pylsl.local_clock()
+        unix = time.time()
+        after = pylsl.local_clock()
+        local = (before + after) / 2
+
+        self._measurements.append((local, correction, unix - local))
+        self._fit()
+
+    def _fit(self):
+        """Fits offset + drift models to the measurements"""
+        local, correction, unix_offset = np.array(self._measurements).T
+        reference = local[-1]
+
+        # a drift fitted to few measurements close in time is mostly noise,
+        # so it is only estimated once the window of measurements is full
+        if len(local) < self._measurements.maxlen or \
+                local[-1] - local[0] < self.interval:
+            self._correction_model = (reference, np.mean(correction), 0.)
+            self._unix_model = (reference, np.mean(unix_offset), 0.)
+            return
+
+        drift, offset = np.polyfit(local - reference, correction, 1)
+        self._correction_model = (reference, offset, drift)
+
+        drift, offset = np.polyfit(local - reference, unix_offset, 1)
+        self._unix_model = (reference, offset, drift)
+
+    #
+    # Converting timestamps
+    #
+
+    @staticmethod
+    def _evaluate(model, timestamps):
+        reference, offset, drift = model
+        return offset + drift * (timestamps - reference)
+
+    def correct(self, timestamps):
+        """
+        Converts timestamps of the inlet's stream to the local LSL clock
+
+        :param timestamps: float or array of remote timestamps
+        :return: corrected timestamps
+        """
+        # the model is fitted against local time, so it is evaluated at an
+        # estimate of the local time rather than at the remote timestamps
+        offset = self._correction_model[1]
+        return timestamps + self._evaluate(self._correction_model,
+                                           timestamps + offset)
+
+    def lsl_to_unix(self, timestamps):
+        """Converts local LSL timestamps to unix time"""
+        return timestamps + self._evaluate(self._unix_model, timestamps)
+
+    def unix_to_lsl(self, timestamps):
+        """Converts unix timestamps to local LSL time"""
+        # the model is evaluated at an estimate of the LSL time; the offset
+        # changes slowly enough for the estimate to be accurate
+        offset = self._unix_model[1]
+        return timestamps - self._evaluate(self._unix_model,
+                                           timestamps - offset)
+
+    def unix_offset(self):
+        """Returns the current difference between unix and local LSL time"""
+        return self._evaluate(self._unix_model, pylsl.local_clock())
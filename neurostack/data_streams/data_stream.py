@@ -2,89 +2,655 @@
 LSL-like object to stream data to multiple channels. Some code and helper
 methods taken from https://github.com/kaczmarj/rteeg
 """
+import asyncio
+import concurrent.futures
+import multiprocessing
 import numpy as np
 import pylsl
 import threading
-import copy
 
+from data_streams.clock_sync import ClockSync
+from data_streams.dejitter import Dejitter
+from data_streams.disk_history import DiskHistory
+from data_streams.marker_index import MarkerIndex
+from data_streams.ring_buffer import RingBuffer
+from data_streams.running_stats import RunningStats
+from data_streams.shared_memory_ingest import SharedRingBuffer, \
+    follow_shared_buffer, record_lsl_to_shared_memory
+from data_streams.stream_cursor import StreamCursor
+from data_streams.stream_discovery import get_stream_discovery
+from data_streams.summary_tier import SummaryTier
 
-def look_for_eeg_stream():
-    """returns an inlet of the first eeg stream outlet found."""
-    print("looking for an EEG stream...")
-    streams = pylsl.resolve_byprop('type', 'EEG', timeout=30)
-    if len(streams) == 0:
-        raise (RuntimeError, "Can't find EEG stream")
+
+# numpy dtypes of numeric LSL channel formats
+LSL_DTYPES = {
+    pylsl.cf_float32: np.float32,
+    pylsl.cf_double64: np.float64,
+    pylsl.cf_int32: np.int32,
+    pylsl.cf_int16: np.int16,
+    pylsl.cf_int8: np.int8,
+}
+
+
+def look_for_stream(stream_type, max_chunklen=0, timeout=30):
+    """
+    returns an inlet of the first stream outlet of a type found. Streams are
+    looked up in the cache of the background stream discovery, so this
+    returns immediately if the stream is already on the network.
+
+    :param stream_type: LSL type of the stream, e.g. 'EEG' or 'Accelerometer'
+    :param max_chunklen: preferred number of samples per chunk sent by the
+                         outlet. If 0, the outlet's chunk size is used.
+    :param timeout: maximum number of seconds to wait for the stream
+    """
+    print(f"looking for an {stream_type} stream...")
+    future = get_stream_discovery().find(stream_type=stream_type)
+    try:
+        info = future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # stop the discovery from resolving it for nobody. If it can't be
+        # cancelled, the stream was found just now.
+        if future.cancel():
+            raise RuntimeError(f"Can't find {stream_type} stream")
+        info = future.result()
     print("Start acquiring data")
-    eeg_inlet = pylsl.StreamInlet(streams[0], max_chunklen=1)
+    inlet = pylsl.StreamInlet(info, max_chunklen=max_chunklen)
+
+    return inlet
 
-    return eeg_inlet
+
+def look_for_eeg_stream(max_chunklen=0):
+    """
+    returns an inlet of the first eeg stream outlet found.
+
+    :param max_chunklen: preferred number of samples per chunk sent by the
+                         outlet. If 0, the outlet's chunk size is used.
+    """
+    return look_for_stream('EEG', max_chunklen)
+
+
+def _resolve(future):
+    """Marks a future waiting for data as done, unless it was cancelled"""
+    if not future.done():
+        future.set_result(None)
 
 
 class DataStream:
 
-    def __init__(self):
-        """Initializes data stream"""
+    def __init__(self, buffer_seconds=60, sample_rate=256, history_dir=None,
+                 history_segment_seconds=600, summary_resolutions=(1, 10),
+                 summary_seconds=7200, dejitter=False, dejitter_halflife=10,
+                 max_seconds=None, max_bytes=None, stats_halflife=None,
+                 stats_seconds=None):
+        """
+        Initializes data stream
+
+        :param buffer_seconds: number of seconds of data kept in memory
+        :param sample_rate: expected sample rate, used to size the buffer. It
+                            is replaced by the nominal rate of the LSL stream
+                            on lsl_connect.
+        :param history_dir: if given, data older than buffer_seconds is moved
+                            to memory-mapped files in this directory instead
+                            of being discarded, and stays queryable
+        :param history_segment_seconds: number of seconds of data per history
+                                        file
+        :param summary_resolutions: resolutions, in seconds, of the min/max/
+                                    mean summaries kept for get_summary.
+                                    They are updated on the ingest thread,
+                                    which costs a few microseconds per
+                                    written block. If empty, no summaries
+                                    are kept and get_summary reads raw data.
+        :param summary_seconds: number of seconds covered by each summary
+        :param dejitter: if True, timestamps are fitted to the sample rate as
+                         they are added, so that they are evenly spaced and
+                         time lookups start from arithmetic and only check
+                         the stored timestamps nearby instead of a full
+                         search. Only use this for streams with a regular
+                         sample rate.
+        :param dejitter_halflife: number of seconds after which a timestamp
+                                  has half its weight in the dejitter fit
+        :param max_seconds: if given, frames (and markers) older than this
+                            many seconds before the newest frame are dropped
+                            as data is written, from memory and disk
+        :param max_bytes: if given, the oldest frames are dropped as data is
+                          written so that the frames kept in memory and on
+                          disk take at most this many bytes
+        :param stats_halflife: number of seconds after which a sample has half
+                               its weight in the exponentially weighted
+                               statistics of get_stats. If None, they are
+                               not kept.
+        :param stats_seconds: length in seconds of the window of the windowed
+                              statistics of get_stats. If None, they are not
+                              kept. Running statistics are updated on the
+                              ingest thread for every written block, which
+                              takes tens of microseconds per block, several
+                              times the cost of writing it, so they are off
+                              unless one of these is given.
+        """
+        # maps channel names to their column in the buffer
         self.channels = {}
 
+        self.buffer_seconds = buffer_seconds
+        self.sample_rate = sample_rate
+        self._buffer = None
+
+        self.history_dir = history_dir
+        self.history_segment_seconds = history_segment_seconds
+        self._history = None
+
+        self.summary_resolutions = sorted(summary_resolutions)
+        self.summary_seconds = summary_seconds
+        self._tiers = None
+
+        self.stats_halflife = stats_halflife
+        self.stats_seconds = stats_seconds
+        self._stats = None
+
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+
+        # sequence number of the oldest frame kept, see truncate_before.
+        # Older frames may still be in the buffer until they are overwritten,
+        # but are no longer read.
+        self._retained = 0
+
+        self.dejitter = dejitter
+        self.dejitter_halflife = dejitter_halflife
+        self._dejitter = None
+
+        # [timestamp, frame] of the frame add_data is filling in. It is only
+        # written once every channel has a value or another frame is written,
+        # so readers and listeners never see a frame change.
+        self._pending_frame = None
+
+        # notified whenever frames are written, for cursors waiting on data
+        self._new_data = threading.Condition()
+
+        # (condition, event loop, future) of coroutines waiting for data
+        self._waiters = []
+
+        # resolved once the first data has been written, see data_ready
+        self._data_ready = concurrent.futures.Future()
+
+        # functions called with every block of written frames. The list is
+        # replaced rather than changed, so writers can iterate it without a
+        # lock.
+        self._listeners = []
+
+        # functions called with every marker added, see add_marker_listener
+        self._marker_listeners = []
+
+        self.stream_type = None
         self._eeg_thread = None
         self._eeg_thread_active = False
         self._eeg_inlet = None
         self._eeg_channel_names = None
 
+        # destination arrays for pulling LSL chunks, see _prepare_lsl_pull
+        self._pull_buffers = None
+
+        # for ingesting in a separate process, see lsl_start_process
+        self._ingest_process = None
+        self._stop_ingest = None
+
+        # converts stream timestamps to the local LSL clock and unix time
+        self.clock = ClockSync()
+
+        # markers (event labels) on the stream's clock, see add_marker
+        self._markers = MarkerIndex()
+        self._marker_lock = threading.Lock()
+        self._marker_inlet = None
+        self._marker_clock = None
+
     #
     # Connection methods
     #
 
-    def lsl_connect(self):
-        """Connects to LSL stream"""
+    def lsl_connect(self, max_chunklen=0, stream_type='EEG', stream_info=None):
+        """
+        Connects to LSL stream
+
+        :param max_chunklen: preferred number of samples per chunk sent by the
+                             outlet. If 0, the outlet's chunk size is used.
+        :param stream_type: LSL type of the stream to connect to
+        :param stream_info: StreamInfo of the stream to connect to, e.g. from
+                            StreamDiscovery. If None, connect to the first
+                            stream of stream_type found.
+        """
         # get stream
-        self._eeg_inlet = look_for_eeg_stream()
+        if stream_info is None:
+            self._eeg_inlet = look_for_stream(stream_type, max_chunklen)
+        else:
+            self._eeg_inlet = pylsl.StreamInlet(stream_info,
+                                                max_chunklen=max_chunklen)
         info = self._eeg_inlet.info()
+        self.stream_type = info.type()
 
-        # get channel names
+        if info.channel_format() not in LSL_DTYPES:
+            raise ValueError(f"{self.stream_type} stream does not have a "
+                             f"numeric channel format")
+
+        # get channel names, numbering channels without a label
         ch_names = []
         this_child = info.desc().child('channels').child('channel')
-        for _ in range(info.channel_count()):
-            ch_names.append(this_child.child_value('label'))
+        for i in range(info.channel_count()):
+            label = this_child.child_value('label')
+            ch_names.append(label if label else f"{self.stream_type}{i}")
             this_child = this_child.next_sibling('channel')
         self._eeg_channel_names = ch_names
 
-    def lsl_start(self):
-        """Start recording data from LSL stream"""
+        if info.nominal_srate() > 0:
+            self.sample_rate = info.nominal_srate()
+
+        # measure the stream's clock offset once before any data is pulled
+        self.clock = ClockSync(self._eeg_inlet)
+        self.clock.measure()
+
+    def lsl_connect_markers(self, stream_type='Markers', stream_info=None):
+        """
+        Connects to an LSL marker stream. Its markers are pulled by the thread
+        that records the data stream and added to the stream's markers.
+
+        :param stream_type: LSL type of the marker stream
+        :param stream_info: StreamInfo of the marker stream. If None, connect
+                            to the first stream of stream_type found.
+        """
+        if stream_info is None:
+            self._marker_inlet = look_for_stream(stream_type)
+        else:
+            self._marker_inlet = pylsl.StreamInlet(stream_info)
+
+        # markers may come from another machine, with a clock of its own
+        self._marker_clock = ClockSync(self._marker_inlet)
+        self._marker_clock.measure()
+        self._marker_clock.start()
+
+    def declare_stream(self, channel_names, stream_type='EEG'):
+        """
+        Sets up a stream that is written to directly instead of being pulled
+        from LSL: adds the channels that do not exist yet, and makes them the
+        stream's EEG channels
+
+        :param channel_names: names of the stream's channels, in order
+        :param stream_type: type of the stream, e.g. 'EEG'
+        :return: None
+        """
+        for channel_name in channel_names:
+            if self.channels.get(channel_name) is None:
+                self.add_channel(channel_name)
+        self._eeg_channel_names = list(channel_names)
+        self.stream_type = stream_type
+
+    def lsl_start(self, chunk_size=32, chunk_timeout=0.1):
+        """
+        Start recording data from LSL stream in a thread of its own. To record
+        several streams with one thread, use an LSLReader instead.
+
+        :param chunk_size: maximum number of samples pulled from the stream at
+                           once
+        :param chunk_timeout: maximum number of seconds to wait for a chunk
+        """
         self._eeg_thread_active = True
+        self.clock.start()
 
         # record data to channels
         self._eeg_thread = threading.Thread(target=self._record_lsl_data_indefinitely,
+                                            args=(chunk_size, chunk_timeout),
                                             name='lsl')
         self._eeg_thread.daemon = True
         self._eeg_thread.start()
 
+    def lsl_start_process(self, chunk_size=32, chunk_timeout=0.1,
+                          poll_interval=0.005):
+        """
+        Start recording data from LSL stream in a separate process, which
+        writes into a ring buffer in shared memory that this stream reads. The
+        ingest process does not share the GIL with this process, so ingest
+        keeps up while this process is busy. Not available with history_dir
+        or dejitter.
+
+        :param chunk_size: maximum number of samples pulled from the stream at
+                           once
+        :param chunk_timeout: maximum number of seconds to wait for a chunk
+        :param poll_interval: number of seconds between checks for new data
+                              by this process
+        """
+        if self.history_dir is not None or self.dejitter:
+            raise ValueError("history_dir and dejitter are not supported when "
+                             "ingesting in a separate process")
+
+        info = self._eeg_inlet.info()
+        n_channels = info.channel_count()
+
+        # the shared buffer has one column per channel of the LSL stream
+        if self._buffer is None:
+            capacity = int(self.buffer_seconds * self.sample_rate)
+            self._buffer = SharedRingBuffer(capacity, n_channels)
+            self._buffer.make_read_only()
+            self.channels = {name: i for i, name
+                             in enumerate(self._eeg_channel_names)}
+        elif not isinstance(self._buffer, SharedRingBuffer):
+            raise RuntimeError("Data stream already has data in this process")
+
+        context = multiprocessing.get_context('spawn')
+        self._stop_ingest = context.Event()
+        self._ingest_process = context.Process(
+            target=record_lsl_to_shared_memory,
+            args=(info.uid(), self._buffer.name, self._buffer.capacity,
+                  n_channels, self._buffer.dtype,
+                  LSL_DTYPES[info.channel_format()], chunk_size, chunk_timeout,
+                  self._stop_ingest),
+            name='lsl ingest')
+        self._ingest_process.daemon = True
+        self._ingest_process.start()
+
+        # timestamps are corrected by the ingest process; this process only
+        # needs the unix <-> LSL offset
+        self.clock = ClockSync()
+        self.clock.start()
+
+        # update summaries and wake up readers as new data arrives
+        self._eeg_thread_active = True
+        self._eeg_thread = threading.Thread(
+            target=follow_shared_buffer,
+            args=(self, poll_interval, lambda: self._eeg_thread_active),
+            name='lsl follower')
+        self._eeg_thread.daemon = True
+        self._eeg_thread.start()
+
     def lsl_stop(self):
         """Stop recording data from LSL stream"""
         self._eeg_thread_active = False
         self._eeg_thread = None
+        self.clock.stop()
 
-    def _record_lsl_data_indefinitely(self):
+        if self._ingest_process is not None:
+            self._stop_ingest.set()
+            self._ingest_process.join()
+            self._ingest_process = None
+
+    def _record_lsl_data_indefinitely(self, chunk_size, chunk_timeout):
         """
         Record LSL data indefinitely
 
-        :param channel_names: channel names to stream samples to
+        :param chunk_size: maximum number of samples pulled at once
+        :param chunk_timeout: maximum number of seconds to wait for a chunk
         :return: does not return
         """
+        self._prepare_lsl_pull(chunk_size)
+
+        # continuously pull data
+        while self._eeg_thread_active:
+            self._pull_lsl_chunk(chunk_timeout)
+
+    def _prepare_lsl_pull(self, chunk_size):
+        """
+        Creates the stream's channels and the preallocated arrays that chunks
+        are pulled into
+
+        :param chunk_size: maximum number of samples pulled at once
+        """
         # create channels
         for channel_name in self._eeg_channel_names:
             if channel_name not in self.list_channels():
                 self.add_channel(channel_name)
 
-        # continuously pull data
-        while self._eeg_thread_active:
-            samples, timestamp = self._eeg_inlet.pull_sample()
-            time_correction = self._eeg_inlet.time_correction()
+        # destination buffers for pulled chunks
+        info = self._eeg_inlet.info()
+        dtype = LSL_DTYPES[info.channel_format()]
+        samples = np.empty((chunk_size, info.channel_count()), dtype=dtype)
+        timestamps = np.empty(chunk_size)
+
+        self._pull_buffers = (timestamps, samples)
+
+    def _pull_lsl_chunk(self, timeout):
+        """
+        Pulls one chunk from the LSL inlet into the preallocated arrays and
+        writes it to the buffer at once
 
-            # add pulled samples to channels
-            for i in range(len(samples)):
-                self.add_data(self._eeg_channel_names[i],
-                              [timestamp + time_correction] + [samples[i]])
+        :param timeout: maximum number of seconds to wait for data
+        :return: number of samples pulled
+        """
+        if self._marker_inlet is not None:
+            self._pull_lsl_markers()
+
+        timestamps, samples = self._pull_buffers
+        _, chunk_timestamps = self._eeg_inlet.pull_chunk(
+            timeout=timeout, max_samples=len(timestamps), dest_obj=samples)
+        n = len(chunk_timestamps)
+        if n == 0:
+            return 0
+
+        timestamps[:n] = chunk_timestamps
+        timestamps[:n] = self.clock.correct(timestamps[:n])
+
+        # add pulled samples to channels as one block
+        self.add_chunk(timestamps[:n], samples[:n], self._eeg_channel_names)
+        return n
+
+    def _pull_lsl_markers(self):
+        """
+        Pulls the markers that are waiting in the LSL marker inlet, without
+        blocking
+
+        :return: number of markers pulled
+        """
+        labels, timestamps = self._marker_inlet.pull_chunk(timeout=0.)
+        if len(timestamps) == 0:
+            return 0
+
+        timestamps = self._marker_clock.correct(np.asarray(timestamps))
+        for timestamp, label in zip(timestamps, labels):
+            self.add_marker(timestamp, label[0])
+        return len(timestamps)
+
+    def _get_buffer(self):
+        """Returns the ring buffer, allocating it on first use"""
+        if self._buffer is None:
+            capacity = int(self.buffer_seconds * self.sample_rate)
+            self._buffer = RingBuffer(capacity, n_channels=len(self.channels))
+            if self.history_dir is not None:
+                self._buffer.on_evict = self._spill
+            if self.dejitter:
+                self._dejitter = Dejitter(self.sample_rate,
+                                          self.dejitter_halflife)
+        return self._buffer
+
+    def _spill(self, timestamps, data):
+        """Moves frames that are evicted from the buffer to the history"""
+        if self._history is None:
+            segment_frames = int(self.history_segment_seconds *
+                                 self.sample_rate)
+            self._history = DiskHistory(self.history_dir,
+                                        n_channels=data.shape[1],
+                                        segment_frames=segment_frames,
+                                        first=self._buffer.first,
+                                        dtype=self._buffer.dtype)
+        self._history.append(timestamps, data)
+
+    def _summarize(self, timestamps, data):
+        """Adds frames to the summary tiers and running statistics"""
+        if not self.summary_resolutions and self.stats_halflife is None and \
+                self.stats_seconds is None:
+            return
+
+        # the tiers keep blocks until their bucket closes, and the caller may
+        # reuse its arrays
+        data = np.array(data, dtype=float)
+
+        if self._tiers is None:
+            n_channels = data.shape[1]
+            self._tiers = [SummaryTier(resolution,
+                                       int(self.summary_seconds / resolution),
+                                       n_channels)
+                           for resolution in self.summary_resolutions]
+        for tier in self._tiers:
+            tier.add(timestamps, data)
+
+        if self.stats_halflife is None and self.stats_seconds is None:
+            return
+        if self._stats is None:
+            self._stats = RunningStats(data.shape[1], self.stats_halflife,
+                                       self.stats_seconds)
+        self._stats.add(timestamps, data)
+
+    def _check_channels_mutable(self):
+        """Channels are fixed once data has been written to the history"""
+        if self._history is not None:
+            raise RuntimeError("Cannot change channels of a data stream with "
+                               "data on disk")
+
+    def _columns_of(self, channels):
+        """
+        Returns the buffer columns of channels
+
+        :raises Exception: if a channel does not exist
+        """
+        columns = []
+        for channel in channels:
+            if self.channels.get(channel) is None:
+                raise Exception(f"A channel with name {channel} does not exist")
+            columns.append(self.channels[channel])
+        return columns
+
+    def _get_columns(self, channels):
+        """
+        Returns the buffer columns of channels, or None if channels are all of
+        the stream's channels in column order (so frames need no reordering)
+        """
+        columns = self._columns_of(channels)
+        if columns == list(range(len(self.channels))):
+            return None
+        return columns
+
+    def _write_frame(self, timestamp, samples, columns=None):
+        """
+        Writes one frame to the buffer
+
+        :param timestamp: timestamp shared by all samples in the frame
+        :param samples: one sample per column
+        :param columns: columns of samples, as returned by _get_columns
+        """
+        self._flush_pending_frame()
+        buffer = self._get_buffer()
+        if columns is not None:
+            frame = np.full(buffer.n_channels, np.nan)
+            frame[columns] = samples
+            samples = frame
+
+        if self._dejitter is not None:
+            timestamp = self._dejitter.apply(buffer.count,
+                                             np.array([timestamp]))[0]
+        buffer.append(timestamp, samples)
+
+        self._after_write(np.array([timestamp]),
+                          np.array([samples], dtype=float))
+
+    def _write_chunk(self, timestamps, samples, columns=None):
+        """
+        Writes a block of frames to the buffer
+
+        :param timestamps: array of shape (n,)
+        :param samples: array of shape (n, len(columns))
+        :param columns: columns of samples, as returned by _get_columns
+        """
+        self._flush_pending_frame()
+        buffer = self._get_buffer()
+        if columns is not None:
+            frames = np.full((len(timestamps), buffer.n_channels), np.nan)
+            frames[:, columns] = samples
+            samples = frames
+
+        if self._dejitter is not None:
+            timestamps = self._dejitter.apply(buffer.count, timestamps)
+        buffer.extend(timestamps, samples)
+
+        self._after_write(timestamps, samples)
+
+    def _flush_pending_frame(self):
+        """Writes the frame add_data is filling in, if there is one"""
+        if self._pending_frame is not None:
+            timestamp, frame = self._pending_frame
+            self._pending_frame = None
+            self._write_frame(timestamp, frame)
+
+    def _after_write(self, timestamps, samples):
+        """Updates summaries and wakes up readers after frames are written"""
+        self._summarize(timestamps, samples)
+        if self.max_seconds is not None or self.max_bytes is not None:
+            self._enforce_retention(timestamps[-1])
+
+        if not self._data_ready.done():
+            self._data_ready.set_result(self)
+
+        for listener in self._listeners:
+            listener(timestamps, samples)
+
+        with self._new_data:
+            self._new_data.notify_all()
+
+            # wake up coroutines whose data has arrived, in their own loop
+            if self._waiters:
+                waiting = []
+                for waiter in self._waiters:
+                    condition, loop, future = waiter
+                    if condition():
+                        loop.call_soon_threadsafe(_resolve, future)
+                    else:
+                        waiting.append(waiter)
+                self._waiters = waiting
+
+    def _enforce_retention(self, newest):
+        """
+        Drops the oldest frames that fall outside max_seconds or max_bytes.
+        Only the oldest timestamp is checked while nothing has expired, and
+        dropping frames moves the start of the stream without touching them.
+
+        :param newest: timestamp of the newest frame
+        :return: None
+        """
+        first = self._first()
+        count = self._buffer.count
+
+        if self.max_bytes is not None:
+            frame_bytes = 8 + self._buffer.n_channels * \
+                self._buffer.dtype.itemsize
+            max_frames = max(self.max_bytes // frame_bytes, 1)
+            if count - first > max_frames:
+                self._truncate(count - max_frames)
+                first = self._first()
+
+        if self.max_seconds is not None and first < count:
+            cutoff = newest - self.max_seconds
+            if self._get_timestamp(first) < cutoff:
+                self._truncate(self._search(cutoff), cutoff)
+
+    async def _wait_for(self, condition, timeout=None):
+        """
+        Waits without blocking the event loop until condition() is true.
+        condition is checked by the thread writing data, each time data is
+        written.
+
+        :param condition: function that returns True once the wait is over
+        :param timeout: maximum number of seconds to wait. If None, wait
+                        indefinitely
+        :return: None
+        :raises asyncio.TimeoutError: if the timeout expires
+        """
+        future = asyncio.get_event_loop().create_future()
+        waiter = (condition, asyncio.get_event_loop(), future)
+
+        with self._new_data:
+            if condition():
+                return
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            with self._new_data:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
 
     def add_channel(self, name):
         """
@@ -96,7 +662,11 @@ class DataStream:
         if self.channels.get(name) is not None:
             print("Channel with name {0} already exists".format(name))
         else:
-            self.channels[name] = []
+            self._check_channels_mutable()
+            self._flush_pending_frame()
+            self.channels[name] = self._get_buffer().add_column()
+            self._tiers = None
+            self._stats = None
 
     def remove_channel(self, name):
         """
@@ -108,81 +678,624 @@ class DataStream:
         if self.channels.get(name) is None:
             print("Channel with name {0} does not exist".format(name))
         else:
-            self.channels.pop(name)
+            self._check_channels_mutable()
+            self._flush_pending_frame()
+            column = self.channels.pop(name)
+            self._buffer.remove_column(column)
+            self._tiers = None
+            self._stats = None
+
+            # shift the columns of the channels that came after it
+            for channel, other in self.channels.items():
+                if other > column:
+                    self.channels[channel] = other - 1
 
     def close(self):
         """Close all connections"""
+        if isinstance(self._buffer, SharedRingBuffer):
+            self.lsl_stop()
+            self._buffer.close()
+
         self.channels = {}
+        self._buffer = None
+        self._tiers = None
+        self._stats = None
+        self._dejitter = None
+        self._pending_frame = None
+        self._retained = 0
+        self._data_ready = concurrent.futures.Future()
+
+        if self._history is not None:
+            self._history.close()
+            self._history = None
+
+        if self._marker_clock is not None:
+            self._marker_clock.stop()
+        self._marker_inlet = None
+        self._marker_clock = None
+        with self._marker_lock:
+            self._markers = MarkerIndex()
 
     #
     # Methods for processing data
     #
 
-    def get_data(self, channels, start_time=None, num_samples=None):
+    def _first(self):
+        """Sequence number of the oldest frame in memory or on disk"""
+        if self._history is not None and len(self._history) > 0:
+            first = self._history.first
+        else:
+            first = self._buffer.first if self._buffer is not None else 0
+        return max(first, self._retained)
+
+    def _get_timestamp(self, seq):
+        """Returns the timestamp of a frame in memory or on disk"""
+        if seq >= self._buffer.first:
+            return self._buffer.get_timestamp(seq)
+        return self._history.get_timestamp(seq)
+
+    def _truncate(self, seq, timestamp=None):
+        """
+        Drops the frames before a sequence number, and the markers before
+        timestamp (or before the oldest frame kept, if timestamp is None).
+        Whole history files are deleted; frames in memory are left to be
+        overwritten.
+
+        :return: None
+        """
+        seq = min(seq, self._buffer.count)
+        if seq > self._retained:
+            self._retained = seq
+            if self._history is not None:
+                self._history.truncate_before(seq)
+
+        if timestamp is None:
+            if seq == self._buffer.count:
+                return
+            timestamp = self._get_timestamp(seq)
+        with self._marker_lock:
+            self._markers.truncate_before(timestamp)
+
+    def _search(self, timestamp, side='left'):
+        """
+        Binary searches frames in memory and on disk for timestamp
+
+        :return: sequence number of the frame found (see RingBuffer.search)
+        """
+        # dejittered timestamps are nearly evenly spaced, so the frame is
+        # close to where the current fit puts it. The fit moves as the device
+        # clock drifts, so the guess is checked against the stored timestamps.
+        if self._dejitter is not None and self._dejitter.offset is not None:
+            seq = self._search_near(timestamp,
+                                    self._dejitter.to_seq(timestamp, side),
+                                    side)
+            if seq is not None:
+                return seq
+
+        if self._history is not None:
+            seq = self._history.search(timestamp, side)
+            if seq < self._history.count:
+                return max(seq, self._retained)
+        return max(self._buffer.search(timestamp, side), self._retained)
+
+    def _search_near(self, timestamp, guess, side='left', radius=32):
+        """
+        Searches the stored timestamps of the frames around a guessed
+        sequence number
+
+        :param timestamp: timestamp to look for
+        :param guess: sequence number the frame is expected at
+        :param side: see RingBuffer.search
+        :param radius: number of frames searched on either side of guess
+        :return: sequence number of the frame found, or None if it is not
+                 within radius frames of guess
+        """
+        first, count = self._first(), self._buffer.count
+        start = min(max(guess - radius, first), count)
+        end = min(max(guess + radius, first), count)
+        timestamps, _ = self._read(start, end, copy=False)
+        if len(timestamps) != end - start:
+            return None
+
+        i = int(np.searchsorted(timestamps, timestamp, side=side))
+        if (i == 0 and start > first) or \
+                (i == len(timestamps) and end < count):
+            return None
+        return start + i
+
+    def _read(self, start, end, copy=True):
+        """
+        Reads frames with sequence numbers in [start, end), from disk if they
+        are no longer in memory. Copies are consistent snapshots, even while
+        frames are being written (see RingBuffer.snapshot).
+
+        :return: (timestamps, data) arrays of shape (n,) and (n, channels)
+        """
+        _, timestamps, data = self._snapshot(start, end, copy)
+        return timestamps, data
+
+    def _snapshot(self, start, end, copy=True):
+        """
+        Reads frames like _read, but also returns where the frames start.
+        Frames before that were dropped or overwritten before they could be
+        read.
+
+        :return: (seq, timestamps, data), seq being the sequence number of the
+                 first frame returned
+        """
+        buffer = self._buffer
+        if buffer is None:
+            return start, np.empty(0), np.empty((0, len(self.channels)))
+        start = max(start, self._retained)
+
+        # frames are moved to disk before they are overwritten, so whatever
+        # the buffer no longer holds after reading it is on disk
+        seq, timestamps, data = buffer.snapshot(start, end, copy=copy)
+        if self._history is None or seq <= start:
+            return seq, timestamps, data
+
+        disk = self._history.read(start, seq)
+        return (seq - len(disk[0]), np.concatenate([disk[0], timestamps]),
+                np.concatenate([disk[1], data]))
+
+    def _index_range(self, start_time=None, end_time=None, num_samples=None):
+        """
+        Finds the range of frames covering a time slice with one binary search
+        per bound.
+
+        :param start_time: start time for data. If None, start from the oldest
+                           data
+        :param end_time: time to stop at (exclusive). If None, no end bound
+        :param num_samples: maximum number of samples in the range
+        :return: (start, end) sequence numbers of the range
+        """
+        start = self._first() if start_time is None else self._search(start_time)
+        end = self._buffer.count if end_time is None else self._search(end_time)
+
+        if num_samples is not None:
+            end = min(end, start + num_samples)
+
+        return start, max(start, end)
+
+    def get_data(self, channels, start_time=None, num_samples=None,
+                 end_time=None):
         """
         Takes a (copy of a) slice of data from channels at start_time for a
         number of samples.
 
         :param channels: channel or list of channels to query
-        :param start_time: start time for data. If None, returns all data
+        :param start_time: start time for data. If None, returns data from the
+                           oldest sample
         :param num_samples: number of data samples to return per channel.
                             If None, return all data after start_time
-        :return: a list of data if there is only 1 channel given, else a dict
-                 with channel names as keys and data as values.
+        :param end_time: time to stop at (exclusive). If None, return all data
+                         after start_time
+        :return: an array of data if there is only 1 channel given, else a
+                 dict with channel names as keys and arrays as values.
         """
-        # get data for 1 channel--just return a list
-        # TODO: do with binary search
+        names = channels if isinstance(channels, list) else [channels]
+
+        # check to see that channels exist
+        self._columns_of(names)
+
+        # one search is shared by all channels
+        start, end = self._index_range(start_time, end_time, num_samples)
+        _, data = self._read(start, end)
+
+        # get data for 1 channel--just return an array
         if not isinstance(channels, list):
-            channel = channels
+            return data[:, self.channels[channels]]
 
-            # check to see that channel exists
-            if self.channels.get(channel) is None:
-                raise Exception(f"A channel with name {channel} does not exist")
+        # get data for multiple channels--return a dict
+        return {channel: data[:, self.channels[channel]]
+                for channel in channels}
 
-            # return all the data for channel if start time is not specified
-            if start_time is None:
-                return [sample[1] for sample in self.channels[channel]]
+    def get_eeg_data(self, start_time=None, num_samples=None, end_time=None):
+        """
+        Get data from EEG channels.
 
-            # find start index
-            start = 0
-            while start_time > self.channels[channel][start][0]:
-                start += 1
-                if start == len(self.channels[channel]):
-                    return []
+        :param start_time: start time for data. If None, returns all data
+        :param num_samples: number of data samples to return per channel.
+                            If None, return all data after start_time
+        :param end_time: time to stop at (exclusive). If None, return all data
+                         after start_time
+        :return: a dict with channel names as keys and arrays as values
+        """
+        return self.get_data(channels=self._eeg_channel_names,
+                             start_time=start_time,
+                             num_samples=num_samples,
+                             end_time=end_time)
+
+    def get_window(self, channels, start_time=None, num_samples=None,
+                   end_time=None):
+        """
+        Gets a (channels, samples) array of data from channels. Unlike
+        get_data, this returns a read-only view straight into the stream
+        buffer whenever possible; a copy is only made if the window wraps
+        around the end of the buffer, reaches into the history on disk, or
+        the channels are not stored next to each other in order. Views are
+        only valid until the buffer wraps past them, so copy the window if it
+        needs to be kept around.
+
+        :param channels: list of channels to query
+        :param start_time: start time for data. If None, returns data from the
+                           oldest sample
+        :param num_samples: number of data samples to return per channel.
+                            If None, return all data after start_time
+        :param end_time: time to stop at (exclusive). If None, return all data
+                         after start_time
+        :return: array of shape (len(channels), samples)
+        """
+        columns = self._columns_of(channels)
 
-            # return all the data starting from start time if number of samples
-            # is not specified
-            if num_samples is None:
-                return [sample[1] for sample in self.channels[channel][start:]]
+        start, end = self._index_range(start_time, end_time, num_samples)
+        _, data = self._read(start, end, copy=False)
 
-            # find end index
-            end = min(len(self.channels[channel]), start + num_samples)
+        # adjacent columns in order can be sliced without copying
+        first = columns[0] if columns else 0
+        if columns == list(range(first, first + len(columns))):
+            window = data[:, first:first + len(columns)].T
+        else:
+            window = data[:, columns].T
 
-            # return time slice from start time for number of samples if both
-            # are specified
-            return [sample[1] for sample in self.channels[channel][start:end]]
+        window.flags.writeable = False
+        return window
 
-        # get data for multiple channels--return a dict
-        return_data = {}
+    def get_snapshot(self, channels, start_time=None, num_samples=None,
+                     end_time=None):
+        """
+        Gets a consistent copy of a window of data from channels, together
+        with its timestamps. Every channel covers exactly the frames of the
+        returned timestamps, even while the stream is being written to: no
+        lock is taken, and frames overwritten during the copy are left out
+        instead of being returned half written.
 
-        for channel in channels:
-            return_data[channel] = self.get_data(channel, start_time,
-                                                 num_samples)
+        :param channels: list of channels to query
+        :param start_time: start time for data. If None, returns data from the
+                           oldest sample
+        :param num_samples: number of data samples to return per channel.
+                            If None, return all data after start_time
+        :param end_time: time to stop at (exclusive). If None, return all data
+                         after start_time
+        :return: (timestamps, window), arrays of shape (samples,) and
+                 (len(channels), samples)
+        """
+        columns = self._columns_of(channels)
 
-        return return_data
+        start, end = self._index_range(start_time, end_time, num_samples)
+        timestamps, data = self._read(start, end)
+        return timestamps, data[:, columns].T
 
-    def get_eeg_data(self, start_time=None, num_samples=None):
+    def get_eeg_window(self, start_time=None, num_samples=None,
+                       end_time=None):
         """
-        Get data from EEG channels.
+        Gets a (channels, samples) array of data from EEG channels. See
+        get_window.
 
         :param start_time: start time for data. If None, returns all data
         :param num_samples: number of data samples to return per channel.
                             If None, return all data after start_time
-        :return: a dict with channel names as keys and data as values
+        :param end_time: time to stop at (exclusive). If None, return all data
+                         after start_time
+        :return: array of shape (EEG channels, samples)
         """
-        return self.get_data(channels=self._eeg_channel_names,
-                             start_time=start_time,
-                             num_samples=num_samples)
+        return self.get_window(channels=self._eeg_channel_names,
+                               start_time=start_time,
+                               num_samples=num_samples,
+                               end_time=end_time)
+
+    def get_summary(self, channels, start_time=None, end_time=None,
+                    max_points=1000):
+        """
+        Gets min/max/mean summaries of channels over a time range, at the
+        finest resolution that returns at most max_points points. Raw data is
+        returned if it fits; otherwise the summary tier whose buckets fit is
+        used, so the cost depends on the number of points returned rather
+        than the number of raw samples in the range.
+
+        :param channels: list of channels to query
+        :param start_time: start time for data. If None, start from the oldest
+                           data
+        :param end_time: time to stop at (exclusive). If None, include the
+                         newest data
+        :param max_points: maximum number of points to return per channel. If
+                           even the coarsest summary has more points, the
+                           coarsest summary is returned.
+        :return: a dict with keys
+                 'resolution': bucket length in seconds, or None for raw data
+                 'timestamps': array of point (bucket start) times
+                 'min', 'max', 'mean': dicts with channel names as keys and
+                 arrays as values
+        """
+        columns = self._columns_of(channels)
+
+        start, end = self._index_range(start_time, end_time)
+        if end - start <= max_points or not self._tiers:
+            timestamps, data = self._read(start, end)
+            resolution = None
+            mins = maxs = means = data[:, columns]
+        else:
+            tier = self._tiers[-1]
+            for candidate in self._tiers:
+                if candidate.count_buckets(start_time, end_time) <= max_points:
+                    tier = candidate
+                    break
+            timestamps, mins, maxs, means = tier.query(columns, start_time,
+                                                       end_time)
+            resolution = tier.resolution
+
+        return {
+            'resolution': resolution,
+            'timestamps': timestamps,
+            'min': {channel: mins[:, i] for i, channel in enumerate(channels)},
+            'max': {channel: maxs[:, i] for i, channel in enumerate(channels)},
+            'mean': {channel: means[:, i] for i, channel in enumerate(channels)}
+        }
+
+    def get_stats(self, channels=None):
+        """
+        Gets running statistics of channels, kept up to date as data is
+        written, so this takes the same time however much data there is. Use
+        them to normalize data or check signal quality without reading it.
+
+        :param channels: list of channels. If None, all channels in the order
+                         of list_channels
+        :return: a dict with keys
+                 'ew_mean', 'ew_var': exponentially weighted mean and
+                 variance, with a half life of stats_halflife seconds
+                 'mean', 'var', 'min', 'max', 'count': statistics of the
+                 samples of the last stats_seconds
+                 each a dict with channel names as keys and floats as values.
+                 Statistics that are not kept, or of channels without data,
+                 are NaN.
+        """
+        names = self.list_channels() if channels is None else channels
+        columns = self._columns_of(names)
+
+        stats = self._stats
+        if stats is None:
+            stats = RunningStats(len(self.channels), self.stats_halflife,
+                                 self.stats_seconds)
+
+        return {key: {channel: float(values[i])
+                      for i, channel in enumerate(names)}
+                for key, values in stats.query(columns).items()}
+
+    def iter_chunks(self, channels=None, start_time=None, end_time=None,
+                    chunk_size=4096):
+        """
+        Iterates over the frames of a time slice in blocks, reading each block
+        from memory or disk only when it is needed, so that any amount of
+        history can be processed in constant memory. Frames that are evicted
+        during the iteration are skipped.
+
+        :param channels: list of channels to read. If None, all channels in
+                         the order of list_channels
+        :param start_time: start time. If None, start from the oldest data
+        :param end_time: time to stop at (exclusive). If None, stop at the
+                         newest frame when iteration starts
+        :param chunk_size: maximum number of frames per block
+        :return: iterator of (timestamps, data) arrays of shape (n,) and
+                 (n, channels)
+        """
+        names = self.list_channels() if channels is None else channels
+        columns = self._columns_of(names)
+        if self._buffer is None:
+            return
+
+        start, end = self._index_range(start_time, end_time)
+        while start < end:
+            start = max(start, self._first())
+            stop = min(start + chunk_size, end)
+            if start >= stop:
+                return
+
+            timestamps, data = self._read(start, stop)
+            yield timestamps, data[:, columns]
+            start = stop
+
+    def add_marker(self, timestamp, label):
+        """
+        Adds a marker (an event label) to the stream
+
+        :param timestamp: time of the event, in the stream's (local LSL) time
+        :param label: label of the event
+        :return: None
+        """
+        with self._marker_lock:
+            self._markers.add(float(timestamp), label)
+
+        for listener in self._marker_listeners:
+            listener(float(timestamp), label)
+
+    def get_markers(self, start_time=None, end_time=None, labels=None):
+        """
+        Returns the markers in a time range
+
+        :param start_time: first time of the range. If None, from the first
+                           marker
+        :param end_time: end of the range (exclusive). If None, up to the last
+                         marker
+        :param labels: label or list of labels of the markers to return. If
+                       None, all markers.
+        :return: (timestamps, labels), an array of shape (n,) and a list
+        """
+        with self._marker_lock:
+            start, end = self._markers.range(start_time, end_time)
+            timestamps = self._markers.timestamps[start:end].copy()
+            marker_labels = self._markers.labels[start:end]
+
+        if labels is not None:
+            labels = labels if isinstance(labels, list) else [labels]
+            keep = [i for i, label in enumerate(marker_labels)
+                    if label in labels]
+            timestamps = timestamps[keep]
+            marker_labels = [marker_labels[i] for i in keep]
+
+        return timestamps, marker_labels
+
+    def get_epochs(self, events=None, tmin=0., tmax=1., channels=None):
+        """
+        Cuts a window of data around each of several events with one read and
+        one fancy-indexing operation. Each window starts at the first frame at
+        or after event + tmin and has round((tmax - tmin) * sample_rate)
+        frames. Frames that do not exist (yet) are NaN.
+
+        :param events: timestamps of the events, or a label or list of labels
+                       of markers to use as events. If None, all markers.
+        :param tmin: start of the window relative to each event, in seconds
+        :param tmax: end of the window relative to each event, in seconds
+        :param channels: list of channels. If None, the EEG channels
+        :return: array of shape (events, channels, samples)
+        """
+        if events is None or isinstance(events, str) or \
+                (isinstance(events, list) and events and
+                 all(isinstance(event, str) for event in events)):
+            events, _ = self.get_markers(labels=events)
+        events = np.asarray(events, dtype=float).reshape(-1)
+
+        channels = self._eeg_channel_names if channels is None else channels
+        columns = self._columns_of(channels)
+        n_samples = int(round((tmax - tmin) * self.sample_rate))
+
+        if len(events) == 0 or n_samples <= 0 or self._buffer is None:
+            return np.full((len(events), len(columns), max(n_samples, 0)),
+                           np.nan)
+
+        # one read covering all windows
+        start = self._search(events.min() + tmin)
+        end = min(self._search(events.max() + tmin) + n_samples,
+                  self.get_sequence_number())
+        timestamps, data = self._read(start, end, copy=False)
+        if len(timestamps) == 0:
+            return np.full((len(events), len(columns), n_samples), np.nan)
+
+        # frame indices of every window. Windows that start before the oldest
+        # frame, and frames that do not exist yet, are missing.
+        first = np.searchsorted(timestamps, events + tmin)
+        indices = first[:, np.newaxis] + np.arange(n_samples)
+        missing = indices >= len(timestamps)
+        if start == self._first():
+            missing[events + tmin < timestamps[0] - 1 / self.sample_rate] = \
+                True
+        indices[missing] = 0
+
+        windows = data[indices[:, :, np.newaxis], np.asarray(columns)] \
+            .astype(float, copy=False)
+        windows[missing] = np.nan
+        return windows.transpose(0, 2, 1)
+
+    def unix_to_lsl(self, timestamps):
+        """
+        Converts unix timestamps to the stream's (local LSL) time
+
+        :param timestamps: float or array of unix timestamps
+        :return: timestamps in stream time
+        """
+        return self.clock.unix_to_lsl(timestamps)
+
+    def lsl_to_unix(self, timestamps):
+        """
+        Converts timestamps in the stream's (local LSL) time to unix time
+
+        :param timestamps: float or array of stream timestamps
+        :return: unix timestamps
+        """
+        return self.clock.lsl_to_unix(timestamps)
+
+    async def wait_until(self, timestamp, timeout=None):
+        """
+        Waits without blocking the event loop until the stream has data at or
+        after a time
+
+        :param timestamp: time in stream (LSL) time
+        :param timeout: maximum number of seconds to wait. If None, wait
+                        indefinitely
+        :return: None
+        :raises asyncio.TimeoutError: if the timeout expires
+        """
+        def has_data_at():
+            return self._buffer is not None and self._buffer.count > 0 and \
+                self._buffer.get_timestamp(self._buffer.count - 1) >= timestamp
+
+        await self._wait_for(has_data_at, timeout)
+
+    async def wait_for_samples(self, num_samples, timeout=None):
+        """
+        Waits without blocking the event loop until a number of new samples
+        has been added to the stream
+
+        :param num_samples: number of samples to wait for, counted from the
+                            time of the call
+        :param timeout: maximum number of seconds to wait. If None, wait
+                        indefinitely
+        :return: None
+        :raises asyncio.TimeoutError: if the timeout expires
+        """
+        seq = self.get_sequence_number() + num_samples
+        await self._wait_for(lambda: self.get_sequence_number() >= seq,
+                             timeout)
+
+    def data_ready(self):
+        """
+        Returns a concurrent.futures.Future that resolves to this stream once
+        the first data has been written to it
+        """
+        return self._data_ready
+
+    def get_sequence_number(self):
+        """Returns the number of frames written to the stream so far"""
+        return self._buffer.count if self._buffer is not None else 0
+
+    def add_listener(self, listener):
+        """
+        Calls a function with every block of frames written to the stream.
+        The function runs on the thread that writes the frames, so it must
+        return quickly, and it must copy the arrays it is passed to keep them.
+
+        :param listener: function called with (timestamps, frames), arrays of
+                         shape (n,) and (n, channels) in the column order of
+                         DataStream.channels
+        :return: None
+        """
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener):
+        """Stops calling a function added with add_listener"""
+        self._listeners = [other for other in self._listeners
+                           if other is not listener]
+
+    def add_marker_listener(self, listener):
+        """
+        Calls a function with every marker added to the stream, whether it is
+        added with add_marker or pulled from an LSL marker stream. The
+        function runs on the thread that adds the marker, so it must return
+        quickly.
+
+        :param listener: function called with (timestamp, label)
+        :return: None
+        """
+        self._marker_listeners = self._marker_listeners + [listener]
+
+    def remove_marker_listener(self, listener):
+        """Stops calling a function added with add_marker_listener"""
+        self._marker_listeners = [other for other in self._marker_listeners
+                                  if other is not listener]
+
+    def subscribe(self, start_time=None):
+        """
+        Creates a cursor that reads all frames written to the stream since its
+        last read, in batches, without missing or repeating frames.
+
+        :param start_time: time of the first frame to read. If None, only
+                           frames written after subscribing are read
+        :return: StreamCursor
+        """
+        if start_time is None or self._buffer is None:
+            seq = self.get_sequence_number()
+        else:
+            seq = self._search(start_time)
+        return StreamCursor(self, seq)
 
     def get_latest_data(self, channels):
         """
@@ -194,53 +1307,133 @@ class DataStream:
         with channel names as keys and data as values.
         """
         if not isinstance(channels, list):
-            return self.channels[channels][-1]
+            timestamp, frame = self._buffer.latest()
+            return [float(timestamp), float(frame[self.channels[channels]])]
 
         return_data = {}
+        latest = self._buffer.latest() \
+            if self.get_sequence_number() > self._first() else None
 
         for channel in channels:
             if self.channels.get(channel) is not None:
                 # If the channel has no data (is empty)
-                if not self.channels[channel]:
+                if latest is None or np.isnan(latest[1][self.channels[channel]]):
                     return_data[channel] = []
                 else:
-                    return_data[channel] = self.get_latest_data(channel)
+                    timestamp, frame = latest
+                    return_data[channel] = [float(timestamp),
+                                            float(frame[self.channels[channel]])]
 
             else:
                 print(f"A channel with name {channel} does not exist")
 
         return return_data
 
-    def add_data(self, channel, data):
+    def add_frame(self, timestamp, samples, channels=None):
         """
-        TODO: decide on / find out about the specific requirements of the data
-        Add data to channel
+        Add one sample to each of several channels. The timestamp is stored
+        once for the whole frame.
 
-        :param channel:
-        :param data:
-        :return:
+        :param timestamp: timestamp of the samples
+        :param samples: one sample per channel
+        :param channels: names of the channels samples belong to. If None,
+                         samples are given for every channel, in the order of
+                         list_channels. Channels that are left out read as NaN.
+        :return: None
         """
-        if self.channels.get(channel) is not None:
-            self.channels[channel].append(data)
+        if channels is None:
+            columns = None
+            if len(samples) != len(self.channels):
+                raise ValueError(f"Expected {len(self.channels)} samples, "
+                                 f"got {len(samples)}")
         else:
-            print(f"A channel with name {channel} does not exist")
+            columns = self._get_columns(channels)
+
+        self._write_frame(timestamp, samples, columns)
 
-    def remove_data(self, channel, data):
+    def add_chunk(self, timestamps, samples, channels=None):
         """
-        TODO: decide on / find out about the specific requirements of the data
-        Remove a specific piece of data from a channel
+        Add a block of frames at once. The block is validated once and copied
+        into the buffer with one vectorized write, which is much faster than
+        adding samples one by one.
 
-        :param channel:
-        :param data:
-        :return:
+        :param timestamps: array of shape (n,), in increasing order
+        :param samples: array of shape (n, channels)
+        :param channels: names of the channels of the columns of samples. If
+                         None, samples has a column for every channel, in the
+                         order of list_channels. Channels that are left out
+                         read as NaN.
+        :return: None
         """
-        if self.channels.get(channel) is not None:
-            try:
-                self.channels[channel].remove(data)
-            except ValueError:
-                raise (ValueError, f"{data} data does not exist in the channel named {channel}")
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        samples = np.asarray(samples)
+
+        n_columns = len(self.channels) if channels is None else len(channels)
+        if timestamps.ndim != 1 or samples.ndim != 2 or \
+                samples.shape != (len(timestamps), n_columns):
+            raise ValueError(f"Expected timestamps of shape (n,) and samples "
+                             f"of shape (n, {n_columns}), got "
+                             f"{timestamps.shape} and {samples.shape}")
+        if len(timestamps) == 0:
+            return
+
+        if channels is None:
+            columns = None
         else:
+            columns = self._get_columns(channels)
+
+        self._write_chunk(timestamps, samples, columns)
+
+    def add_data(self, channel, data):
+        """
+        Add data to channel. Values added to different channels with the same
+        timestamp are stored in the same frame; channels that have not been
+        given a value for a frame read as NaN. A frame is written once every
+        channel has a value in it, or else when a frame with another timestamp
+        is written, so it can be read and is passed to listeners only then. To
+        add samples of all channels at once, use add_chunk.
+
+        :param channel: name of channel to add data to
+        :param data: [timestamp, value]
+        :return: None
+        """
+        if self.channels.get(channel) is None:
             print(f"A channel with name {channel} does not exist")
+            return
+
+        timestamp, value = data
+        column = self.channels[channel]
+
+        # fill in the pending frame if it is the frame for this timestamp and
+        # this channel has no value in it yet
+        pending = self._pending_frame
+        if pending is None or pending[0] != timestamp or \
+                not np.isnan(pending[1][column]):
+            self._flush_pending_frame()
+            pending = [timestamp, np.full(len(self.channels), np.nan)]
+            self._pending_frame = pending
+        pending[1][column] = value
+
+        if not np.isnan(pending[1]).any():
+            self._flush_pending_frame()
+
+    def truncate_before(self, timestamp):
+        """
+        Drops all frames and markers before a time, from memory and disk.
+        Only the start of the stream is moved and whole history files are
+        deleted, so this takes the same time however much data is dropped.
+
+        :param timestamp: time of the oldest frame to keep
+        :return: number of frames dropped
+        """
+        if self._buffer is None:
+            with self._marker_lock:
+                self._markers.truncate_before(timestamp)
+            return 0
+
+        first = self._first()
+        self._truncate(self._search(timestamp), timestamp)
+        return self._first() - first
 
     def has_data(self, channel):
         """
@@ -249,7 +1442,12 @@ class DataStream:
         :param channel: channel
         :return: True if the channel has data, False otherwise
         """
-        return not len(self.channels.get(channel, [])) == 0
+        if self.channels.get(channel) is None or self._buffer is None \
+                or len(self._buffer) == 0:
+            return False
+
+        _, data = self._buffer.read(self._first())
+        return bool(np.any(~np.isnan(data[:, self.channels[channel]])))
 
     #
     # Stream information
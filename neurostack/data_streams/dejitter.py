@@ -0,0 +1,77 @@
+"""
+Dejittering of timestamps for streams with a regular sample rate. Arrival
+times are fitted to t = offset + seq / sample_rate, where seq is the sample's
+sequence number in the stream, so timestamps and sequence numbers can be
+converted into each other with arithmetic.
+
+The offset keeps adapting when the device clock drifts from the nominal rate,
+so timestamps fitted earlier no longer lie exactly on the current line, and
+to_seq is only a close guess of where a stored timestamp is.
+"""
+import numpy as np
+
+
+class Dejitter:
+
+    def __init__(self, sample_rate, halflife=10.):
+        """
+        Initializes the model
+
+        :param sample_rate: nominal sample rate of the stream
+        :param halflife: number of seconds after which a timestamp has half of
+                         its original weight in the offset estimate
+        """
+        if sample_rate <= 0:
+            raise ValueError("Dejittering needs a regular sample rate")
+
+        self.sample_rate = float(sample_rate)
+        self.offset = None
+
+        # weight of the newest timestamp in the exponentially weighted offset
+        self._alpha = 1 - 0.5 ** (1 / (halflife * self.sample_rate))
+
+    def apply(self, seq, timestamps):
+        """
+        Updates the model with the timestamps of a block of samples, and
+        returns the dejittered timestamps of the block
+
+        :param seq: sequence number of the first sample
+        :param timestamps: array of arrival times of shape (n,)
+        :return: array of dejittered timestamps of shape (n,)
+        """
+        n = len(timestamps)
+        if n == 0:
+            return timestamps
+
+        seqs = seq + np.arange(n)
+        residuals = timestamps - seqs / self.sample_rate
+
+        if self.offset is None:
+            self.offset = residuals[0]
+
+        # exponentially weighted mean over the block, in closed form
+        decay = (1 - self._alpha) ** np.arange(n - 1, -1, -1)
+        self.offset = (1 - self._alpha) ** n * self.offset + \
+            self._alpha * np.dot(decay, residuals)
+
+        return self.offset + seqs / self.sample_rate
+
+    def to_seq(self, timestamp, side='left'):
+        """
+        Converts a timestamp to a sequence number with the current fit. For
+        timestamps that were fitted a while ago this can be off by a few
+        samples.
+
+        :param timestamp: timestamp to convert
+        :param side: 'left' for the first sample at or after timestamp,
+                     'right' for the first sample strictly after it
+        :return: sequence number (not clamped to the samples that exist)
+        """
+        position = (timestamp - self.offset) * self.sample_rate
+        if side == 'left':
+            return int(np.ceil(position - 1e-9))
+        return int(np.floor(position + 1e-9)) + 1
+
+    def to_timestamp(self, seq):
+        """Converts a sequence number to its dejittered timestamp"""
+        return self.offset + seq / self.sample_rate
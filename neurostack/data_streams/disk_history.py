@@ -0,0 +1,212 @@
+"""
+Append-only on-disk history of sample frames. Frames are written to fixed-size
+segment files that are memory-mapped for reading, so old data is served from
+the page cache instead of being kept on the Python heap.
+"""
+import bisect
+import os
+
+import numpy as np
+
+
+class _Segment:
+
+    def __init__(self, directory, index, first, capacity, n_channels, dtype):
+        """Creates the files for a segment starting at sequence number first"""
+        name = os.path.join(directory, f"segment_{index:06d}")
+        self.timestamps_path = name + '.timestamps'
+        self.data_path = name + '.data'
+
+        self.first = first
+        self.count = 0
+        self.timestamps = np.memmap(self.timestamps_path, dtype=np.float64,
+                                    mode='w+', shape=(capacity,))
+        self.data = np.memmap(self.data_path, dtype=dtype, mode='w+',
+                              shape=(capacity, n_channels))
+
+    def seal(self):
+        """Flushes a full segment and reopens it read-only"""
+        self.timestamps.flush()
+        self.data.flush()
+        self.timestamps = np.memmap(self.timestamps_path, dtype=np.float64,
+                                    mode='r', shape=self.timestamps.shape)
+        self.data = np.memmap(self.data_path, dtype=self.data.dtype,
+                              mode='r', shape=self.data.shape)
+
+    def delete(self):
+        """Removes the segment's files"""
+        self.timestamps = None
+        self.data = None
+        os.remove(self.timestamps_path)
+        os.remove(self.data_path)
+
+
+class DiskHistory:
+
+    def __init__(self, directory, n_channels, segment_frames, first=0,
+                 dtype=np.float64):
+        """
+        Initializes an empty history
+
+        :param directory: directory to write segment files to. It is created
+                          if it does not exist.
+        :param n_channels: number of channels per frame
+        :param segment_frames: number of frames per segment file
+        :param first: sequence number of the first frame that will be appended
+        :param dtype: dtype used to store samples
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.n_channels = n_channels
+        self.segment_frames = int(segment_frames)
+        self.dtype = np.dtype(dtype)
+
+        self._segments = []
+        self._segment_firsts = []       # first sequence number per segment
+        self._segment_starts = []       # first timestamp per segment
+        self._next_index = 0
+
+        self.first = first
+        self.count = first
+
+    def __len__(self):
+        return self.count - self.first
+
+    #
+    # Writing
+    #
+
+    def append(self, timestamps, data):
+        """
+        Appends frames to the end of the history
+
+        :param timestamps: array of shape (n,)
+        :param data: array of shape (n, n_channels)
+        :return: None
+        """
+        written = 0
+        while written < len(timestamps):
+            segment = self._segments[-1] if self._segments else None
+            if segment is None or segment.count == self.segment_frames:
+                if segment is not None:
+                    segment.seal()
+                segment = self._new_segment()
+
+            n = min(len(timestamps) - written,
+                    self.segment_frames - segment.count)
+            segment.timestamps[segment.count:segment.count + n] = \
+                timestamps[written:written + n]
+            segment.data[segment.count:segment.count + n] = \
+                data[written:written + n]
+
+            if segment.count == 0:
+                self._segment_starts.append(float(timestamps[written]))
+            segment.count += n
+            written += n
+            self.count += n
+
+    def _new_segment(self):
+        """Starts a new segment file"""
+        segment = _Segment(self.directory, self._next_index, self.count,
+                           self.segment_frames, self.n_channels, self.dtype)
+        self._next_index += 1
+        self._segments.append(segment)
+        self._segment_firsts.append(segment.first)
+
+        return segment
+
+    def close(self):
+        """Deletes all segment files"""
+        for segment in self._segments:
+            segment.delete()
+        self._segments = []
+        self._segment_firsts = []
+        self._segment_starts = []
+        self.first = self.count
+
+    def truncate_before(self, seq):
+        """
+        Deletes the segment files whose frames all come before a sequence
+        number. The segment being written to is kept.
+
+        :param seq: sequence number of the oldest frame to keep
+        :return: None
+        """
+        n = bisect.bisect_right(self._segment_firsts, seq) - 1
+        n = min(n, len(self._segments) - 1)
+        if n <= 0:
+            return
+
+        for segment in self._segments[:n]:
+            segment.delete()
+        del self._segments[:n]
+        del self._segment_firsts[:n]
+        del self._segment_starts[:n]
+        self.first = self._segments[0].first
+
+    #
+    # Reading
+    #
+
+    def search(self, timestamp, side='left'):
+        """
+        Binary searches the timestamps in the history
+
+        :param timestamp: timestamp to look for
+        :param side: 'left' to find the first frame at or after timestamp,
+                     'right' to find the first frame strictly after it
+        :return: sequence number of the frame found, or count if there is none
+        """
+        if not self._segments:
+            return self.count
+
+        # find the last segment that could contain timestamp, then search it
+        if side == 'left':
+            i = bisect.bisect_left(self._segment_starts, timestamp) - 1
+        else:
+            i = bisect.bisect_right(self._segment_starts, timestamp) - 1
+        i = max(i, 0)
+
+        segment = self._segments[i]
+        offset = int(np.searchsorted(segment.timestamps[:segment.count],
+                                     timestamp, side=side))
+        return segment.first + offset
+
+    def get_timestamp(self, seq):
+        """Returns the timestamp of a frame in the history"""
+        if not self.first <= seq < self.count:
+            raise IndexError(f"Frame {seq} is not in the history")
+        segment = self._segments[bisect.bisect_right(self._segment_firsts,
+                                                     seq) - 1]
+        return segment.timestamps[seq - segment.first]
+
+    def read(self, start=None, end=None):
+        """
+        Reads frames with sequence numbers in [start, end) in time order
+
+        :param start: first sequence number, defaults to the oldest frame
+        :param end: sequence number to stop at, defaults to the newest frame
+        :return: (timestamps, data) arrays of shape (n,) and (n, n_channels)
+        """
+        start = self.first if start is None else max(start, self.first)
+        end = self.count if end is None else min(end, self.count)
+
+        timestamps = []
+        data = []
+        i = max(bisect.bisect_right(self._segment_firsts, start) - 1, 0)
+        while start < end:
+            segment = self._segments[i]
+            begin = start - segment.first
+            stop = min(end - segment.first, segment.count)
+            timestamps.append(segment.timestamps[begin:stop])
+            data.append(segment.data[begin:stop])
+            start = segment.first + stop
+            i += 1
+
+        if not timestamps:
+            return (np.empty(0),
+                    np.empty((0, self.n_channels), dtype=self.dtype))
+
+        return np.concatenate(timestamps), np.concatenate(data)
@@ -0,0 +1,86 @@
+"""
+Single reader thread that ingests several LSL streams at once. Each connected
+DataStream is polled in turn with non-blocking pulls, so a device with EEG and
+auxiliary sensor streams needs one thread instead of one per stream. Every
+stream's timestamps are corrected to the local LSL clock, so all streams share
+a common clock.
+"""
+import threading
+import time
+
+
+class LSLReader:
+
+    def __init__(self, chunk_size=32, chunk_timeout=0.1, idle_sleep=0.005):
+        """
+        Initializes a reader with no streams
+
+        :param chunk_size: maximum number of samples pulled from a stream at
+                           once
+        :param chunk_timeout: maximum number of seconds to wait for a chunk
+                              when there is only one stream to read
+        :param idle_sleep: number of seconds to sleep when none of several
+                           streams had new data
+        """
+        self.chunk_size = chunk_size
+        self.chunk_timeout = chunk_timeout
+        self.idle_sleep = idle_sleep
+
+        self.data_streams = []
+
+        self._thread = None
+        self._active = False
+
+    def add(self, data_stream):
+        """
+        Adds a data stream to read. The stream must be connected with
+        lsl_connect.
+
+        :param data_stream: DataStream
+        :return: None
+        """
+        data_stream._prepare_lsl_pull(self.chunk_size)
+        self.data_streams.append(data_stream)
+
+        if self._active:
+            data_stream.clock.start()
+
+    def start(self):
+        """Start reading all streams in a background thread"""
+        self._active = True
+        for data_stream in self.data_streams:
+            data_stream.clock.start()
+
+        self._thread = threading.Thread(target=self._read_indefinitely,
+                                        name='lsl reader')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop reading"""
+        self._active = False
+        self._thread = None
+        for data_stream in self.data_streams:
+            data_stream.clock.stop()
+
+    def _read_indefinitely(self):
+        """
+        Polls every stream for new chunks, sleeping only when none of them had
+        data
+
+        :return: does not return
+        """
+        while self._active:
+            data_streams = list(self.data_streams)
+
+            # a single stream can block on its inlet instead of polling
+            if len(data_streams) == 1:
+                data_streams[0]._pull_lsl_chunk(self.chunk_timeout)
+                continue
+
+            pulled = 0
+            for data_stream in data_streams:
+                pulled += data_stream._pull_lsl_chunk(timeout=0.)
+
+            if pulled == 0:
+                time.sleep(self.idle_sleep)
@@ -0,0 +1,92 @@
+"""
+Sorted index of the markers (event labels with timestamps) of a data stream.
+Timestamps are kept in a growable NumPy array, so markers in a time range are
+found with one binary search per bound.
+"""
+import numpy as np
+
+
+class MarkerIndex:
+
+    def __init__(self, capacity=1024):
+        """
+        Initializes an empty index
+
+        :param capacity: initial number of markers the arrays have room for
+        """
+        self._timestamps = np.empty(capacity)
+        self._labels = []
+
+    def __len__(self):
+        return len(self._labels)
+
+    @property
+    def timestamps(self):
+        """Read-only view of the sorted marker timestamps"""
+        view = self._timestamps[:len(self._labels)]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def labels(self):
+        """Labels of the markers, in the order of timestamps"""
+        return self._labels
+
+    def add(self, timestamp, label):
+        """
+        Adds a marker, keeping the index sorted. Markers usually arrive in
+        order and are appended; late markers are inserted.
+
+        :param timestamp: timestamp of the marker
+        :param label: label of the marker
+        :return: None
+        """
+        n = len(self._labels)
+        if n == len(self._timestamps):
+            grown = np.empty(2 * max(n, 1))
+            grown[:n] = self._timestamps
+            self._timestamps = grown
+
+        if n == 0 or timestamp >= self._timestamps[n - 1]:
+            self._timestamps[n] = timestamp
+            self._labels.append(label)
+            return
+
+        i = int(np.searchsorted(self._timestamps[:n], timestamp, side='right'))
+        self._timestamps[i + 1:n + 1] = self._timestamps[i:n]
+        self._timestamps[i] = timestamp
+        self._labels.insert(i, label)
+
+    def range(self, start_time=None, end_time=None):
+        """
+        Finds the markers in a time range
+
+        :param start_time: first time of the range. If None, from the first
+                           marker
+        :param end_time: end of the range (exclusive). If None, up to the last
+                         marker
+        :return: (start, end) indices of the markers in the range
+        """
+        timestamps = self._timestamps[:len(self._labels)]
+        start = 0 if start_time is None else \
+            int(np.searchsorted(timestamps, start_time))
+        end = len(timestamps) if end_time is None else \
+            int(np.searchsorted(timestamps, end_time))
+        return start, max(start, end)
+
+    def truncate_before(self, timestamp):
+        """
+        Removes the markers before a time
+
+        :param timestamp: time of the oldest marker to keep
+        :return: number of markers removed
+        """
+        n = len(self._labels)
+        i = int(np.searchsorted(self._timestamps[:n], timestamp))
+        if i > 0:
+            self._timestamps[:n - i] = self._timestamps[i:n]
+            del self._labels[:i]
+        return i
+
+    def clear(self):
+        self._labels = []
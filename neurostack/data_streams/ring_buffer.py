@@ -0,0 +1,248 @@
+"""
+Fixed-capacity storage for multi-channel sample frames. Samples are kept in a
+preallocated 2-D array (samples x channels) next to a single timestamp array,
+and new frames overwrite the oldest ones once the buffer is full.
+
+Readers on other threads never take a lock. The writer works like a seqlock
+whose version is the frame count: before writing, it reserves the frames it
+is about to write, and after writing it publishes them by advancing count.
+Readers only read published frames, and check the reservation after copying
+to detect frames that were overwritten while they were being copied.
+"""
+import numpy as np
+
+
+class RingBuffer:
+
+    def __init__(self, capacity, n_channels=0, dtype=np.float64):
+        """
+        Initializes an empty ring buffer
+
+        :param capacity: maximum number of frames kept in memory
+        :param n_channels: number of channels (columns) per frame
+        :param dtype: dtype used to store samples
+        """
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.data = np.full((self.capacity, n_channels), np.nan,
+                            dtype=self.dtype)
+
+        # total number of frames ever written. The frame with sequence number
+        # seq lives at row seq % capacity while it is still in the buffer.
+        self.count = 0
+
+        # frame count the writer is writing up to. Frames before
+        # reserved - capacity may be overwritten at any time.
+        self.reserved = 0
+
+        # called with (timestamps, data) of frames about to be overwritten
+        self.on_evict = None
+
+    def __len__(self):
+        return self.count - self.first
+
+    @property
+    def n_channels(self):
+        return self.data.shape[1]
+
+    @property
+    def first(self):
+        """Sequence number of the oldest frame still in the buffer"""
+        return max(0, self.count - self.capacity)
+
+    #
+    # Writing
+    #
+
+    def append(self, timestamp, frame):
+        """
+        Writes one frame, overwriting the oldest frame if the buffer is full
+
+        :param timestamp: timestamp of the frame
+        :param frame: sequence of n_channels values
+        :return: sequence number of the written frame
+        """
+        row = self.count % self.capacity
+        if self.on_evict is not None and self.count >= self.capacity:
+            self.on_evict(self.timestamps[row:row + 1], self.data[row:row + 1])
+
+        self.reserved = self.count + 1
+        self.timestamps[row] = timestamp
+        self.data[row] = frame
+        self.count += 1
+
+        return self.count - 1
+
+    def extend(self, timestamps, data):
+        """
+        Writes a block of frames with at most two slice assignments,
+        overwriting the oldest frames if the buffer is full
+
+        :param timestamps: array of shape (n,)
+        :param data: array of shape (n, n_channels)
+        :return: sequence number of the first written frame
+        """
+        first_seq = self.count
+
+        # blocks larger than the buffer are written one buffer-full at a time
+        for offset in range(0, len(timestamps), self.capacity):
+            self._extend(timestamps[offset:offset + self.capacity],
+                         data[offset:offset + self.capacity])
+
+        return first_seq
+
+    def _extend(self, timestamps, data):
+        """Writes at most capacity frames"""
+        n = len(timestamps)
+        evicted = self.count + n - self.capacity - self.first
+        if self.on_evict is not None and evicted > 0:
+            self.on_evict(*self.read(self.first, self.first + evicted,
+                                     copy=False))
+
+        self.reserved = self.count + n
+        begin = self.count % self.capacity
+        split = min(n, self.capacity - begin)
+        self.timestamps[begin:begin + split] = timestamps[:split]
+        self.data[begin:begin + split] = data[:split]
+        self.timestamps[:n - split] = timestamps[split:]
+        self.data[:n - split] = data[split:]
+
+        self.count += n
+
+    def add_column(self):
+        """
+        Appends a channel column. Existing frames get NaN for the new channel.
+
+        :return: index of the new column
+        """
+        column = np.full((self.capacity, 1), np.nan, dtype=self.dtype)
+        self.data = np.hstack([self.data, column])
+
+        return self.n_channels - 1
+
+    def remove_column(self, column):
+        """Removes a channel column"""
+        self.data = np.delete(self.data, column, axis=1)
+
+    def clear(self):
+        """Forgets all frames without releasing memory"""
+        self.count = 0
+        self.reserved = 0
+
+    #
+    # Reading
+    #
+
+    def get_timestamp(self, seq):
+        """Returns the timestamp of a frame that is still in the buffer"""
+        if not self.first <= seq < self.count:
+            raise IndexError(f"Frame {seq} is not in the buffer")
+        return self.timestamps[seq % self.capacity]
+
+    def search(self, timestamp, side='left'):
+        """
+        Binary searches the (sorted) timestamps of the frames in the buffer
+
+        :param timestamp: timestamp to look for
+        :param side: 'left' to find the first frame at or after timestamp,
+                     'right' to find the first frame strictly after it
+        :return: sequence number of the frame found, or count if there is none
+        """
+        first = self.first
+        n = self.count - first
+        head = first % self.capacity
+
+        # frames are stored in time order, split in at most two segments
+        if head + n <= self.capacity:
+            older = self.timestamps[head:head + n]
+            newer = self.timestamps[:0]
+        else:
+            older = self.timestamps[head:]
+            newer = self.timestamps[:head + n - self.capacity]
+
+        if len(newer) == 0 or timestamp < newer[0] or \
+                (side == 'left' and timestamp == newer[0]):
+            return first + int(np.searchsorted(older, timestamp, side=side))
+
+        return first + len(older) + \
+            int(np.searchsorted(newer, timestamp, side=side))
+
+    def read(self, start=None, end=None, copy=True):
+        """
+        Reads frames with sequence numbers in [start, end) in time order
+
+        :param start: first sequence number, defaults to the oldest frame
+        :param end: sequence number to stop at, defaults to the newest frame
+        :param copy: if False, return read-only views into the buffer when the
+                     frames are contiguous in memory. A copy is only made when
+                     the range wraps around the end of the buffer. Views are
+                     overwritten once the buffer wraps past them.
+        :return: (timestamps, data) arrays of shape (n,) and (n, n_channels)
+        """
+        _, timestamps, data = self.snapshot(start, end, copy)
+        return timestamps, data
+
+    def snapshot(self, start=None, end=None, copy=True):
+        """
+        Reads frames like read, but also returns where the frames start.
+        Copies are consistent even while another thread writes: frames that
+        were overwritten during the copy are left out, so the copy holds
+        every channel of a contiguous range of frames.
+
+        :return: (seq, timestamps, data), seq being the sequence number of the
+                 first frame returned
+        """
+        count = self.count
+        first = max(0, count - self.capacity)
+        start = first if start is None else max(start, first)
+        end = count if end is None else min(end, count)
+
+        start = min(start, end)
+        while True:
+            timestamps, data = self._copy(start, end, copy)
+
+            # rows of frames before this may have been overwritten
+            intact = self.reserved - self.capacity
+            if not copy or intact <= start or start == end:
+                return start, timestamps, data
+            start = min(intact, end)
+
+    def _copy(self, start, end, copy=True):
+        """Reads the rows of published frames [start, end)"""
+        begin = start % self.capacity
+        stop = begin + (end - start)
+
+        if stop <= self.capacity:
+            timestamps = self.timestamps[begin:stop]
+            data = self.data[begin:stop]
+            if copy:
+                return timestamps.copy(), data.copy()
+
+            timestamps = timestamps.view()
+            data = data.view()
+            timestamps.flags.writeable = False
+            data.flags.writeable = False
+            return timestamps, data
+
+        # range wraps around the end of the buffer
+        stop -= self.capacity
+        timestamps = np.concatenate([self.timestamps[begin:],
+                                     self.timestamps[:stop]])
+        data = np.concatenate([self.data[begin:], self.data[:stop]])
+        return timestamps, data
+
+    def latest(self):
+        """
+        Returns the newest frame
+
+        :return: (timestamp, frame) or None if the buffer is empty
+        """
+        if self.count == 0:
+            return None
+        row = (self.count - 1) % self.capacity
+        return self.timestamps[row], self.data[row].copy()
@@ -0,0 +1,193 @@
+"""
+Per-channel running statistics of a data stream, updated incrementally as
+data is added: an exponentially weighted mean and variance, and the mean,
+variance, minimum and maximum over a sliding time window.
+
+Blocks of frames are summarized once, as (count, mean, sum of squared
+deviations, min, max), and blocks are combined with the pairwise form of
+Welford's algorithm, which stays accurate where sums of squares would not.
+The window is a queue of block summaries made of two stacks, so adding and
+expiring blocks takes amortized constant time however long the window is.
+The current statistics are published as one tuple after each update, so
+they are read in constant time and never half updated.
+"""
+import numpy as np
+
+
+def _summarize(values, weights, minimum, maximum):
+    """
+    Summarizes a block of frames
+
+    :param values: array of shape (n, channels), with 0 for NaN values
+    :param weights: array of shape (n, channels) of weights, 0 for NaN values
+    :param minimum: array of shape (channels,) of minimums of the block
+    :param maximum: array of shape (channels,) of maximums of the block
+    :return: (count, mean, m2, min, max) arrays of shape (channels,), count
+             being the sum of weights and m2 the weighted sum of squared
+             deviations from the mean
+    """
+    count = weights.sum(axis=0)
+    mean = np.divide((weights * values).sum(axis=0), count,
+                     out=np.zeros(values.shape[1]), where=count > 0)
+    deviations = values - mean
+    m2 = (weights * deviations * deviations).sum(axis=0)
+    return count, mean, m2, minimum, maximum
+
+
+def _merge(a, b):
+    """Combines the summaries of two blocks of frames"""
+    count_a, mean_a, m2_a, min_a, max_a = a
+    count_b, mean_b, m2_b, min_b, max_b = b
+
+    count = count_a + count_b
+    fraction = np.divide(count_b, count, out=np.zeros_like(count),
+                         where=count > 0)
+    delta = mean_b - mean_a
+    return (count, mean_a + delta * fraction,
+            m2_a + m2_b + delta ** 2 * count_a * fraction,
+            np.fmin(min_a, min_b), np.fmax(max_a, max_b))
+
+
+def _empty(n_channels):
+    """Summary of no frames"""
+    return (np.zeros(n_channels), np.zeros(n_channels), np.zeros(n_channels),
+            np.full(n_channels, np.nan), np.full(n_channels, np.nan))
+
+
+class RunningStats:
+
+    def __init__(self, n_channels, halflife=None, window_seconds=None):
+        """
+        Initializes empty statistics
+
+        :param n_channels: number of channels
+        :param halflife: number of seconds after which a sample has half its
+                         weight in the exponentially weighted statistics. If
+                         None, they are not kept.
+        :param window_seconds: length of the sliding window in seconds. Whole
+                               blocks are expired once their newest frame is
+                               older than this. If None, windowed statistics
+                               are not kept.
+        """
+        self.n_channels = n_channels
+        self.halflife = halflife
+        self.window_seconds = window_seconds
+
+        # (timestamp of the newest frame, summary) of the weighted frames
+        self.weighted = None
+
+        # summary of the frames in the window
+        self.window = _empty(n_channels)
+
+        # the window's queue of (newest timestamp, summary) per block. Blocks
+        # are added to the back. The front holds older blocks, newest first,
+        # each with the summary of itself and all newer blocks in the front.
+        self._back = []
+        self._back_total = _empty(n_channels)
+        self._front = []
+        self._newest = -np.inf
+
+    def add(self, timestamps, data):
+        """
+        Adds a block of frames. NaN values are ignored.
+
+        :param timestamps: sorted array of shape (n,)
+        :param data: array of shape (n, n_channels)
+        :return: None
+        """
+        if len(timestamps) == 0:
+            return
+
+        valid = ~np.isnan(data)
+        values = np.where(valid, data, 0.)
+        valid = valid.astype(float)
+        minimum = np.fmin.reduce(data, axis=0)
+        maximum = np.fmax.reduce(data, axis=0)
+        newest = float(timestamps[-1])
+
+        if self.halflife is not None:
+            ages = newest - np.asarray(timestamps, dtype=float)
+            weights = valid * (0.5 ** (ages / self.halflife))[:, None]
+            self._add_weighted(_summarize(values, weights, minimum, maximum),
+                               newest)
+        if self.window_seconds is not None:
+            self._add_to_window(_summarize(values, valid, minimum, maximum),
+                                newest)
+
+    def _add_weighted(self, block, newest):
+        """Decays the weighted statistics and adds a block summary to them"""
+        if self.weighted is None:
+            self.weighted = (newest, block)
+            return
+
+        # older frames lose weight for the time that has passed. Frames added
+        # late, with timestamps before the newest, do not make the others
+        # gain weight.
+        last, (count, mean, m2, minimum, maximum) = self.weighted
+        decay = 0.5 ** (max(newest - last, 0.) / self.halflife)
+        self.weighted = (max(newest, last),
+                         _merge((count * decay, mean, m2 * decay, minimum,
+                                 maximum), block))
+
+    def _add_to_window(self, block, newest):
+        """Adds a block summary to the window and expires old blocks"""
+        self._back.append((newest, block))
+        self._back_total = _merge(self._back_total, block)
+
+        self._newest = max(self._newest, newest)
+        cutoff = self._newest - self.window_seconds
+        while True:
+            if not self._front:
+                self._flip()
+            if self._front[-1][0] >= cutoff or \
+                    (len(self._front) == 1 and not self._back):
+                break
+            self._front.pop()
+
+        self.window = _merge(self._front[-1][1], self._back_total) \
+            if self._front else self._back_total
+
+    def _flip(self):
+        """Moves the blocks of the back to the front"""
+        total = _empty(self.n_channels)
+        for newest, block in reversed(self._back):
+            total = _merge(block, total)
+            self._front.append((newest, total))
+        self._back = []
+        self._back_total = _empty(self.n_channels)
+
+    def query(self, columns):
+        """
+        Gets the current statistics. Variances are population variances.
+
+        :param columns: channel columns to get statistics of
+        :return: dict with keys 'ew_mean' and 'ew_var' (exponentially
+                 weighted) and 'mean', 'var', 'min', 'max' and 'count' (over
+                 the window), each an array of shape (len(columns),). Values
+                 of statistics that are not kept, or of channels without
+                 data, are NaN.
+        """
+        nan = np.full(len(columns), np.nan)
+        stats = {}
+
+        weighted = self.weighted
+        if weighted is None:
+            stats['ew_mean'] = stats['ew_var'] = nan
+        else:
+            count, mean, m2 = (array[columns] for array in weighted[1][:3])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stats['ew_mean'] = np.where(count > 0, mean, np.nan)
+                stats['ew_var'] = m2 / count
+
+        count, mean, m2, minimum, maximum = \
+            (array[columns] for array in self.window)
+        if self.window_seconds is None:
+            count = nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats['mean'] = np.where(count > 0, mean, np.nan)
+            stats['var'] = m2 / count
+        stats['min'] = minimum
+        stats['max'] = maximum
+        stats['count'] = count
+
+        return stats
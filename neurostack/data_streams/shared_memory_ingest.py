@@ -0,0 +1,182 @@
+"""
+Out-of-process LSL ingest. A separate process pulls chunks from an LSL inlet
+and writes them into a ring buffer in shared memory, so ingest does not share
+the GIL with the event loop or model training in the main process.
+
+The only synchronisation is the pair of frame counters of RingBuffer (count
+and reserved), kept at the start of the shared block so that readers in
+other processes see them.
+"""
+import time
+
+import numpy as np
+import pylsl
+
+from data_streams.clock_sync import ClockSync
+from data_streams.ring_buffer import RingBuffer
+
+# bytes reserved before the timestamps, holding the frame counters
+HEADER_SIZE = 64
+
+
+class SharedRingBuffer(RingBuffer):
+
+    def __init__(self, capacity, n_channels, dtype=np.float64, name=None):
+        """
+        Creates a ring buffer in shared memory, or attaches to an existing one
+
+        :param capacity: maximum number of frames kept in memory
+        :param n_channels: number of channels (columns) per frame
+        :param dtype: dtype used to store samples
+        :param name: name of the shared memory block to attach to. If None, a
+                     new block is created.
+        """
+        # only available from python 3.8
+        from multiprocessing import shared_memory
+
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self.on_evict = None
+
+        size = HEADER_SIZE + 8 * self.capacity + \
+            self.dtype.itemsize * self.capacity * n_channels
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        # [published frame count, reserved frame count]
+        self._header = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)
+        self.timestamps = np.ndarray((self.capacity,), dtype=np.float64,
+                                     buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.data = np.ndarray((self.capacity, n_channels), dtype=self.dtype,
+                               buffer=self.shm.buf,
+                               offset=HEADER_SIZE + 8 * self.capacity)
+        if self.owner:
+            self._header[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def count(self):
+        return int(self._header[0])
+
+    @count.setter
+    def count(self, value):
+        # publishing the new count makes the frames written before visible
+        self._header[0] = value
+
+    @property
+    def reserved(self):
+        return int(self._header[1])
+
+    @reserved.setter
+    def reserved(self, value):
+        self._header[1] = value
+
+    def make_read_only(self):
+        """Prevents writes through this process's views of the buffer"""
+        self.timestamps.flags.writeable = False
+        self.data.flags.writeable = False
+
+    def add_column(self):
+        raise RuntimeError("Channels of a shared ring buffer are fixed")
+
+    def remove_column(self, column):
+        raise RuntimeError("Channels of a shared ring buffer are fixed")
+
+    def snapshot(self, start=None, end=None, copy=True):
+        """
+        Copies frames with sequence numbers in [start, end) in time order.
+        Views are never returned, since the writer is in another process.
+        """
+        return super().snapshot(start, end, copy=True)
+
+    def close(self):
+        """Detaches from the shared memory, freeing it if this process owns it"""
+        self._header = None
+        self.timestamps = None
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def record_lsl_to_shared_memory(uid, shm_name, capacity, n_channels, dtype,
+                                sample_dtype, chunk_size, chunk_timeout,
+                                stop_event):
+    """
+    Runs in the ingest process. Pulls chunks from the LSL stream with the
+    given uid and writes them into the shared ring buffer until stop_event is
+    set.
+
+    :param uid: uid of the LSL stream to record
+    :param shm_name: name of the shared memory block of the ring buffer
+    :param capacity: capacity of the ring buffer
+    :param n_channels: number of channels of the stream
+    :param dtype: dtype of the ring buffer
+    :param sample_dtype: dtype matching the stream's channel format
+    :param chunk_size: maximum number of samples pulled at once
+    :param chunk_timeout: maximum number of seconds to wait for a chunk
+    :param stop_event: multiprocessing.Event that stops recording
+    :return: None
+    """
+    streams = pylsl.resolve_bypred(f"uid='{uid}'", timeout=30)
+    if len(streams) == 0:
+        raise RuntimeError(f"Can't find stream with uid {uid}")
+    inlet = pylsl.StreamInlet(streams[0], max_chunklen=chunk_size)
+
+    clock = ClockSync(inlet)
+    clock.measure()
+    clock.start()
+
+    buffer = SharedRingBuffer(capacity, n_channels, dtype=dtype, name=shm_name)
+
+    samples = np.empty((chunk_size, n_channels), dtype=sample_dtype)
+    timestamps = np.empty(chunk_size)
+
+    while not stop_event.is_set():
+        _, chunk_timestamps = inlet.pull_chunk(
+            timeout=chunk_timeout, max_samples=chunk_size, dest_obj=samples)
+        n = len(chunk_timestamps)
+        if n == 0:
+            continue
+
+        timestamps[:n] = chunk_timestamps
+        timestamps[:n] = clock.correct(timestamps[:n])
+        buffer.extend(timestamps[:n], samples[:n])
+
+    clock.stop()
+    buffer.close()
+
+
+def follow_shared_buffer(data_stream, poll_interval, is_active):
+    """
+    Runs in a thread of the main process. Watches the frame counter of a
+    stream's shared ring buffer and runs the stream's post-write updates
+    (summaries, cursors, waiting coroutines) for new frames.
+
+    :param data_stream: DataStream reading from the shared ring buffer
+    :param poll_interval: number of seconds between checks of the counter
+    :param is_active: function that returns False once following should stop
+    :return: None
+    """
+    buffer = data_stream._buffer
+    seen = buffer.count
+
+    while is_active():
+        if data_stream._marker_inlet is not None:
+            data_stream._pull_lsl_markers()
+
+        count = buffer.count
+        if count == seen:
+            time.sleep(poll_interval)
+            continue
+
+        timestamps, samples = buffer.read(max(seen, count - buffer.capacity),
+                                          count)
+        seen = count
+        data_stream._after_write(timestamps, samples)
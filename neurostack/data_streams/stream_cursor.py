@@ -0,0 +1,85 @@
+"""
+Read position of one consumer in a data stream. Each frame written to a
+stream gets a sequence number, and a cursor remembers the sequence number of
+the next frame its consumer has not read yet.
+"""
+import asyncio
+
+
+class StreamCursor:
+
+    def __init__(self, data_stream, seq):
+        """
+        Initializes a cursor. Use DataStream.subscribe to create cursors.
+
+        :param data_stream: stream to read from
+        :param seq: sequence number of the first frame to read
+        """
+        self.data_stream = data_stream
+        self.seq = seq
+
+        # number of frames that were evicted before this cursor read them
+        self.dropped = 0
+
+    def available(self):
+        """Returns the number of frames written since the last read"""
+        return self.data_stream.get_sequence_number() - self.seq
+
+    def wait(self, timeout=None):
+        """
+        Blocks until there are frames that have not been read
+
+        :param timeout: maximum number of seconds to wait. If None, wait
+                        indefinitely
+        :return: True if there are frames to read, False on timeout
+        """
+        with self.data_stream._new_data:
+            return self.data_stream._new_data.wait_for(
+                lambda: self.available() > 0, timeout)
+
+    async def wait_async(self, timeout=None):
+        """
+        Waits without blocking the event loop until there are frames that have
+        not been read
+
+        :param timeout: maximum number of seconds to wait. If None, wait
+                        indefinitely
+        :return: True if there are frames to read, False on timeout
+        """
+        try:
+            await self.data_stream._wait_for(lambda: self.available() > 0,
+                                             timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def read(self, channels=None, max_frames=None):
+        """
+        Reads all frames written since the last read, in one batch
+
+        :param channels: list of channels to read. If None, read all channels
+                         in the order of DataStream.list_channels
+        :param max_frames: maximum number of frames to read. If None, read
+                           everything available
+        :return: (timestamps, data) arrays of shape (n,) and (n, channels)
+        """
+        stream = self.data_stream
+
+        # frames that are no longer in memory or on disk are lost
+        first = stream._first()
+        if self.seq < first:
+            self.dropped += first - self.seq
+            self.seq = first
+
+        end = stream.get_sequence_number()
+        if max_frames is not None:
+            end = min(end, self.seq + max_frames)
+
+        # frames can also be overwritten while they are being read
+        seq, timestamps, data = stream._snapshot(self.seq, end)
+        self.dropped += seq - self.seq
+        self.seq = seq + len(timestamps)
+
+        if channels is not None:
+            data = data[:, stream._columns_of(channels)]
+        return timestamps, data
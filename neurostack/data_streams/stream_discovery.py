@@ -0,0 +1,156 @@
+"""
+Background discovery of LSL streams. A continuous resolver keeps a cache of
+the streams currently on the network, so looking up a stream is an instant
+query instead of a blocking resolve, and several devices can wait for their
+streams at the same time.
+"""
+import concurrent.futures
+import threading
+
+import pylsl
+
+
+class StreamDiscovery:
+
+    def __init__(self, interval=0.05, forget_after=5.):
+        """
+        Initializes stream discovery. Call start to begin discovering.
+
+        :param interval: number of seconds between refreshes of the cache
+        :param forget_after: number of seconds after which a stream that is no
+                             longer visible is removed from the cache
+        """
+        self.interval = interval
+        self.forget_after = forget_after
+
+        # StreamInfo of every stream on the network, by uid
+        self._streams = {}
+
+        # (properties, future) of pending find calls
+        self._pending = []
+        self._lock = threading.Lock()
+
+        # set once the cache has been refreshed for the first time
+        self._refreshed = threading.Event()
+
+        self._resolver = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start discovering streams in a background thread"""
+        if self._thread is not None:
+            return
+
+        self._resolver = pylsl.ContinuousResolver(
+            forget_after=self.forget_after)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._discover_indefinitely,
+                                        name='lsl discovery')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop discovering streams"""
+        self._stopped.set()
+        self._thread = None
+
+    def _discover_indefinitely(self):
+        """Refreshes the cache and resolves pending find calls"""
+        while not self._stopped.is_set():
+            streams = {info.uid(): info for info in self._resolver.results()}
+
+            with self._lock:
+                self._streams = streams
+                pending = []
+                for properties, future in self._pending:
+                    if future.cancelled():
+                        continue
+                    matches = self._match(streams.values(), properties)
+                    if matches:
+                        # marking the future running stops look_for_stream
+                        # from cancelling it between the check and the result
+                        if future.set_running_or_notify_cancel():
+                            future.set_result(matches[0])
+                    else:
+                        pending.append((properties, future))
+                self._pending = pending
+
+            self._refreshed.set()
+            self._stopped.wait(self.interval)
+
+    @staticmethod
+    def _match(infos, properties):
+        """Returns the stream infos whose properties have the given values"""
+        getters = {
+            'type': lambda info: info.type(),
+            'name': lambda info: info.name(),
+            'source_id': lambda info: info.source_id(),
+            'uid': lambda info: info.uid(),
+        }
+        return [info for info in infos
+                if all(getters[key](info) == value
+                       for key, value in properties.items()
+                       if value is not None)]
+
+    def wait_until_refreshed(self, timeout=None):
+        """
+        Blocks until the cache has been filled for the first time
+
+        :param timeout: maximum number of seconds to wait
+        :return: True if the cache has been filled, False on timeout
+        """
+        return self._refreshed.wait(timeout)
+
+    def streams(self, stream_type=None, name=None, source_id=None):
+        """
+        Returns the cached StreamInfo of streams on the network, without
+        waiting
+
+        :param stream_type: only return streams of this LSL type
+        :param name: only return streams with this name
+        :param source_id: only return streams with this source id
+        :return: list of StreamInfo
+        """
+        with self._lock:
+            return self._match(self._streams.values(),
+                               {'type': stream_type, 'name': name,
+                                'source_id': source_id})
+
+    def find(self, stream_type=None, name=None, source_id=None, uid=None):
+        """
+        Finds a stream, now if it is in the cache or else as soon as it
+        appears on the network
+
+        :param stream_type: LSL type of the stream
+        :param name: name of the stream
+        :param source_id: source id of the stream
+        :param uid: uid of the stream
+        :return: concurrent.futures.Future that resolves to a StreamInfo
+        """
+        properties = {'type': stream_type, 'name': name,
+                      'source_id': source_id, 'uid': uid}
+        future = concurrent.futures.Future()
+
+        with self._lock:
+            matches = self._match(self._streams.values(), properties)
+            if matches:
+                future.set_result(matches[0])
+            else:
+                self._pending.append((properties, future))
+
+        return future
+
+
+_discovery = None
+_discovery_lock = threading.Lock()
+
+
+def get_stream_discovery():
+    """Returns the shared, running StreamDiscovery"""
+    global _discovery
+    with _discovery_lock:
+        if _discovery is None:
+            _discovery = StreamDiscovery()
+            _discovery.start()
+        return _discovery
@@ -0,0 +1,172 @@
+"""
+Decimated min/max/mean summaries of a data stream at a fixed time resolution,
+updated incrementally as data is added. Blocks of frames that fall in the
+bucket being filled are only queued, and are summarized together when the
+bucket closes, so most blocks cost no NumPy work at all.
+"""
+import math
+
+import numpy as np
+
+from data_streams.ring_buffer import RingBuffer
+
+
+class SummaryTier:
+
+    def __init__(self, resolution, capacity, n_channels):
+        """
+        Initializes an empty summary tier
+
+        :param resolution: length of each summary bucket, in seconds
+        :param capacity: number of closed buckets to keep
+        :param n_channels: number of channels to summarize
+        """
+        self.resolution = resolution
+        self.n_channels = n_channels
+
+        # closed buckets, stored with columns [min..., max..., sum..., count...]
+        self._buckets = RingBuffer(capacity, n_channels=4 * n_channels)
+
+        # bucket that is still being filled
+        self._bucket_id = None
+        self._min = np.full(n_channels, np.nan)
+        self._max = np.full(n_channels, np.nan)
+        self._sum = np.zeros(n_channels)
+        self._count = np.zeros(n_channels)
+
+        # blocks of frames in the bucket being filled that are not part of
+        # its min/max/sum/count yet
+        self._pending = []
+
+    def add(self, timestamps, data):
+        """
+        Adds frames to the summary. NaN values are ignored. The data array is
+        kept until its bucket closes, so it must not be changed afterwards.
+
+        :param timestamps: sorted array of shape (n,)
+        :param data: array of shape (n, n_channels)
+        :return: None
+        """
+        if len(timestamps) == 0:
+            return
+
+        # blocks inside the bucket being filled are summarized later
+        if self._bucket_id is not None and \
+                math.floor(timestamps[0] / self.resolution) == \
+                self._bucket_id and \
+                math.floor(timestamps[-1] / self.resolution) == \
+                self._bucket_id:
+            self._pending.append(data)
+            return
+        self._add_pending()
+
+        ids = np.floor(np.asarray(timestamps) / self.resolution)
+        valid = ~np.isnan(data)
+        values = np.where(valid, data, 0)
+
+        # split frames into runs that fall in the same bucket
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        mins = np.fmin.reduceat(data, starts, axis=0)
+        maxs = np.fmax.reduceat(data, starts, axis=0)
+        sums = np.add.reduceat(values, starts, axis=0)
+        counts = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+
+        for i, bucket_id in enumerate(ids[starts]):
+            if bucket_id != self._bucket_id:
+                self._close_bucket()
+                self._bucket_id = bucket_id
+
+            self._min = np.fmin(self._min, mins[i])
+            self._max = np.fmax(self._max, maxs[i])
+            self._sum += sums[i]
+            self._count += counts[i]
+
+    def _summarize_pending(self):
+        """
+        Returns the min, max, sum and count of the bucket being filled,
+        including the queued blocks
+        """
+        pending = self._pending
+        minimum, maximum = self._min, self._max
+        total, count = self._sum, self._count
+        if pending:
+            data = np.concatenate(pending)
+            valid = ~np.isnan(data)
+            minimum = np.fmin(minimum, np.fmin.reduce(data, axis=0))
+            maximum = np.fmax(maximum, np.fmax.reduce(data, axis=0))
+            total = total + np.where(valid, data, 0).sum(axis=0)
+            count = count + valid.sum(axis=0)
+        return minimum, maximum, total, count
+
+    def _add_pending(self):
+        """Adds the queued blocks to the bucket being filled"""
+        if self._pending:
+            self._min, self._max, self._sum, self._count = \
+                self._summarize_pending()
+            self._pending = []
+
+    def _close_bucket(self):
+        """Moves the bucket being filled to the closed buckets"""
+        if self._bucket_id is None:
+            return
+
+        self._buckets.append(self._bucket_id * self.resolution,
+                             np.concatenate([self._min, self._max,
+                                             self._sum, self._count]))
+        self._min = np.full(self.n_channels, np.nan)
+        self._max = np.full(self.n_channels, np.nan)
+        self._sum = np.zeros(self.n_channels)
+        self._count = np.zeros(self.n_channels)
+
+    def count_buckets(self, start_time=None, end_time=None):
+        """Returns the number of buckets that a query would return"""
+        start, end = self._range(start_time, end_time)
+        n = end - start
+        if self._open_bucket_in_range(start_time, end_time):
+            n += 1
+        return n
+
+    def _range(self, start_time, end_time):
+        """Sequence numbers of closed buckets overlapping [start_time, end_time)"""
+        buckets = self._buckets
+        start = buckets.first if start_time is None else \
+            buckets.search(start_time - self.resolution, side='right')
+        end = buckets.count if end_time is None else buckets.search(end_time)
+        return start, max(start, end)
+
+    def _open_bucket_in_range(self, start_time, end_time):
+        """Checks if the bucket being filled overlaps [start_time, end_time)"""
+        if self._bucket_id is None:
+            return False
+        bucket_start = self._bucket_id * self.resolution
+        return (start_time is None or
+                bucket_start + self.resolution > start_time) and \
+            (end_time is None or bucket_start < end_time)
+
+    def query(self, columns, start_time=None, end_time=None):
+        """
+        Gets summaries of buckets overlapping [start_time, end_time)
+
+        :param columns: channel columns to summarize
+        :param start_time: start time. If None, start from the oldest bucket
+        :param end_time: end time. If None, include the newest bucket
+        :return: (timestamps, mins, maxs, means), where timestamps are bucket
+                 start times of shape (n,) and the others are arrays of shape
+                 (n, len(columns))
+        """
+        start, end = self._range(start_time, end_time)
+        timestamps, buckets = self._buckets.read(start, end)
+        mins, maxs, sums, counts = np.split(buckets, 4, axis=1)
+
+        if self._open_bucket_in_range(start_time, end_time):
+            minimum, maximum, total, count = self._summarize_pending()
+            timestamps = np.r_[timestamps, self._bucket_id * self.resolution]
+            mins = np.vstack([mins, minimum])
+            maxs = np.vstack([maxs, maximum])
+            sums = np.vstack([sums, total])
+            counts = np.vstack([counts, count])
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums[:, columns] / counts[:, columns]
+
+        return timestamps, mins[:, columns], maxs[:, columns], means
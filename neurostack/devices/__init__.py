@@ -1,4 +1,7 @@
 from devices.device import Device
 from devices.muse import Muse
 from devices.muse2014 import Muse2014
+from devices.direct_feed_device import DirectFeedDevice
+from devices.replay_device import ReplayDevice
+from devices.virtual_device import VirtualDevice, VirtualDeviceFarm
 # from devices.openbci import OpenBCI
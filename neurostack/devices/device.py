@@ -1,31 +1,63 @@
 from abc import ABC, abstractmethod
+import concurrent.futures
 
 from data_streams.data_stream import DataStream
 
 
 class Device(ABC):
 
-    def __init__(self, device_id=None):
+    def __init__(self, device_id=None, data_stream=None):
+        """
+        :param device_id: id of the device
+        :param data_stream: DataStream the device writes its EEG to. If None,
+                            a DataStream with default settings is created.
+        """
         self.device_id = device_id
-        self.data_stream = DataStream()
+        self.data_stream = data_stream if data_stream is not None \
+            else DataStream()
+
+        # all of the device's streams by LSL type, including the EEG stream
+        self.data_streams = {'EEG': self.data_stream}
+
+    def _wait_for_data(self, finished):
+        """
+        Blocks until the data stream has data, for devices whose data is
+        written by a thread of their own
+
+        :param finished: concurrent.futures.Future that the writing thread
+                         resolves when it ends, or fails with its exception
+        :return: the data stream
+        :raises Exception: if the thread ends before writing any data
+        """
+        ready = self.data_stream.data_ready()
+        concurrent.futures.wait([ready, finished],
+                                return_when=concurrent.futures.FIRST_COMPLETED)
+        if ready.done():
+            return ready.result()
+
+        # raises the exception of the thread if it failed
+        finished.result()
+        raise RuntimeError("Device stopped before writing any data")
 
     @abstractmethod
-    def connect(self, device_id=None) -> None:
+    def connect(self, device_id=None) -> concurrent.futures.Future:
         """
         Connect to EEG device with id specified. If id is not specified,
-        connect to randomly selected EEG device.
+        connect to randomly selected EEG device. Must not block, so that
+        several devices can connect at the same time.
 
         :param device_id:
-        :return:
+        :return: future that resolves once the device is connected
         """
         pass
 
     @abstractmethod
-    def start(self) -> None:
+    def start(self) -> concurrent.futures.Future:
         """
-        Start streaming EEG from device, and publish data to subscribers.
+        Start streaming EEG from device, and publish data to subscribers. Must
+        not block.
 
-        :return:
+        :return: future that resolves once there is data from the device
         """
         pass
 
@@ -0,0 +1,184 @@
+"""
+Device that writes NumPy chunks straight into its DataStream with add_chunk,
+the same bulk write the LSL readers use, without any LSL outlet or inlet in
+between. Storage, query and model code can be profiled with it in isolation,
+and with fixed timestamps and seed its data is the same on every run.
+"""
+import concurrent.futures
+import threading
+import time
+
+import numpy as np
+import pylsl
+
+from data_streams.data_stream import DataStream
+from devices import Device
+from devices.synthetic_eeg import SyntheticEEG
+from utils import generate_uuid, resolved_future, run_in_background
+
+
+class DirectFeedDevice(Device):
+
+    def __init__(self, device_id=None, n_channels=8, sample_rate=256,
+                 chunk_size=32, realtime=True, start_time=None,
+                 max_samples=None, buffer_seconds=60, seed=None):
+        """
+        :param device_id: id of the device
+        :param n_channels: number of EEG channels
+        :param sample_rate: number of samples per second
+        :param chunk_size: number of samples written at once
+        :param realtime: if True, write samples when they are due at the
+                         sample rate. If False, write them as fast as possible.
+        :param start_time: timestamp of the first sample. If None, the LSL
+                           time when streaming starts.
+        :param max_samples: number of samples after which to stop writing. If
+                            None, write until stopped.
+        :param buffer_seconds: number of seconds of data kept in memory
+        :param seed: seed of the synthetic EEG
+        """
+        super().__init__(device_id if device_id is not None
+                         else generate_uuid(),
+                         DataStream(buffer_seconds=buffer_seconds,
+                                    sample_rate=sample_rate))
+
+        self.chunk_size = chunk_size
+        self.realtime = realtime
+        self.start_time = start_time
+        self.max_samples = max_samples
+        self.generator = SyntheticEEG(n_channels=n_channels,
+                                      sample_rate=sample_rate, seed=seed)
+        self.channel_names = [f"EEG{i}" for i in range(n_channels)]
+
+        self._feed_thread = None
+        self._active = False
+
+        # resolved when the feed thread ends, see _feed_until_error
+        self._finished = None
+
+        # number of samples written to the data stream
+        self.fed_samples = 0
+
+    @property
+    def sample_rate(self):
+        return self.generator.sample_rate
+
+    #
+    # Feeding data
+    #
+
+    def feed(self, samples, timestamps=None):
+        """
+        Writes a chunk of samples to the device's data stream
+
+        :param samples: array of shape (n, channels)
+        :param timestamps: array of shape (n,). If None, samples follow the
+                           previous ones at the sample rate.
+        :return: None
+        """
+        if len(samples) == 0:
+            return
+
+        if timestamps is None:
+            if self.start_time is None:
+                self.start_time = pylsl.local_clock()
+            timestamps = self.start_time + \
+                (self.fed_samples + np.arange(len(samples))) / self.sample_rate
+
+        self.data_stream.add_chunk(timestamps, samples, self.channel_names)
+        self.fed_samples += len(samples)
+
+    def _feed_until_error(self):
+        """Runs the feed, resolving _finished with its outcome"""
+        try:
+            self._feed_indefinitely()
+        except Exception as e:
+            print(f"Direct feed of {self.device_id} stopped: {e}")
+            self._finished.set_exception(e)
+        else:
+            self._finished.set_result(self.fed_samples)
+        finally:
+            self._active = False
+
+    def _feed_indefinitely(self):
+        """
+        Writes synthetic chunks until stopped or max_samples are written
+
+        :return: None
+        """
+        if self.start_time is None:
+            self.start_time = pylsl.local_clock() - \
+                self.fed_samples / self.sample_rate
+
+        while self._active:
+            n = self.chunk_size
+            if self.max_samples is not None:
+                n = min(n, self.max_samples - self.fed_samples)
+                if n <= 0:
+                    break
+
+            if self.realtime:
+                # the last sample of the chunk is due at its timestamp
+                deadline = self.start_time + \
+                    (self.fed_samples + n - 1) / self.sample_rate
+                wait = deadline - pylsl.local_clock()
+                if wait > 0:
+                    time.sleep(wait)
+
+            self.feed(self.generator.generate(n))
+
+    #
+    # Public device methods
+    #
+
+    def connect(self):
+        """
+        Creates the channels of the data stream
+
+        :return: concurrent.futures.Future that is already resolved
+        """
+        self.data_stream.declare_stream(self.channel_names)
+        return resolved_future()
+
+    def start(self):
+        """
+        Start writing synthetic EEG in a background thread
+
+        :return: concurrent.futures.Future that resolves once there is data,
+                 or fails if writing stops before there is any
+        """
+        self._active = True
+        self._finished = concurrent.futures.Future()
+        self._feed_thread = threading.Thread(target=self._feed_until_error,
+                                             name='direct feed')
+        self._feed_thread.daemon = True
+        self._feed_thread.start()
+
+        return run_in_background(self._wait_for_data, self._finished)
+
+    def stop(self):
+        """Stop writing data"""
+        self._active = False
+        if self._feed_thread is not None:
+            self._feed_thread.join()
+            self._feed_thread = None
+
+    def join(self, timeout=None):
+        """
+        Blocks until max_samples are written
+
+        :param timeout: maximum number of seconds to wait
+        :return: True if writing has finished, False on timeout
+        """
+        if self._feed_thread is not None:
+            self._feed_thread.join(timeout)
+        return not self._active
+
+    def shutdown(self):
+        """Stop writing data and free the data stream's storage"""
+        self.stop()
+        self.data_stream.close()
+
+    def get_info(self):
+        """Print info about device"""
+        print(f"Device ID: {self.device_id}, {len(self.channel_names)} "
+              f"channels at {self.sample_rate:g} Hz, fed directly")
@@ -1,21 +1,40 @@
 from data_streams.data_stream import DataStream
+from data_streams.lsl_reader import LSLReader
 from devices import Device
+from devices.synthetic_eeg import SyntheticEEG
+from utils import run_in_background
 
 import pylsl
-import random
 import threading
-import time
 
 
 class Muse(Device):
 
-    def __init__(self, device_id=None):
+    def __init__(self, device_id=None, chunk_size=12, chunk_timeout=0.1,
+                 ingest_process=False):
+        """
+        :param device_id: id of the device
+        :param chunk_size: maximum number of samples read from the device at
+                           once. The Muse sends 12 samples per packet.
+        :param chunk_timeout: maximum number of seconds to wait for a chunk
+        :param ingest_process: if True, read each stream in a separate process
+                               that writes to shared memory (see
+                               DataStream.lsl_start_process)
+        """
         super().__init__(device_id)
 
-        # difference between unix and muse time
-        self.time_diff = 0
+        self.chunk_size = chunk_size
+        self.chunk_timeout = chunk_timeout
+        self.ingest_process = ingest_process
+
+        # reads all of the muse's streams
+        self._reader = None
+
+        # resolves once all streams are connected, see connect
+        self._connected = None
 
-        # for generating fake data
+        # for generating fake data. Use fake_eeg to inject events.
+        self.fake_eeg = None
         self._fake_muse = None
         self._fake_muse_active = False
 
@@ -25,16 +44,12 @@ class Muse(Device):
 
     def _create_fake_eeg_stream(self):
         """
-        Method for generating dummy EEG data for the muse. Sends randomly-
-        generated data through an LSL outlet.
+        Method for generating dummy EEG data for the muse. Sends synthetic EEG
+        with a 1/f background and alpha rhythm through an LSL outlet, at
+        exactly 256Hz.
 
         :return: None
         """
-        def generate_muse_data():
-            """Generate 4 random floats, representing channels AF7, AF8, TP9,
-            and TP10 on the muse headset"""
-            return [random.random() for _ in range(4)]
-
         # create fake muse
         info = pylsl.StreamInfo(name='Muse', type='EEG', channel_count=4,
                                 nominal_srate=256, channel_format='float32',
@@ -50,26 +65,36 @@ class Muse(Device):
                 .append_child_value("unit", "microvolts") \
                 .append_child_value("type", "EEG")
 
-        outlet = pylsl.StreamOutlet(info)
+        outlet = pylsl.StreamOutlet(info, chunk_size=self.chunk_size)
 
         # continuously push data to outlet when active
-        while self._fake_muse_active:
-            outlet.push_sample(generate_muse_data())
-            time.sleep(0.00390625)  # 256Hz
+        self.fake_eeg.push_to(outlet, self.chunk_size,
+                              lambda: self._fake_muse_active)
 
     #
     # Public device methods
     #
 
-    def connect(self, fake_data=False):
+    def connect(self, fake_data=False, aux_stream_types=()):
         """
         Creates data streams if there are none and connects to EEG stream
         (since that is the one that is immediately needed for use). If fake_data
         is True, then start a separate thread that generates fake data instead
         of connecting to a muse.
+
+        Connecting happens in the background, so several devices can connect
+        at the same time.
+
+        :param fake_data: generate fake EEG data instead of using a muse
+        :param aux_stream_types: LSL types of other streams published by the
+                                 muse to connect to, e.g. 'Accelerometer',
+                                 'Gyroscope' or 'PPG'
+        :return: concurrent.futures.Future that resolves once all streams are
+                 connected
         """
         # create thread that runs something which continuously streams data
         if fake_data:
+            self.fake_eeg = SyntheticEEG(n_channels=4, sample_rate=256)
             eeg_data_thread = threading.Thread(
                 target=self._create_fake_eeg_stream, name='fake muse')
             eeg_data_thread.daemon = True
@@ -78,36 +103,72 @@ class Muse(Device):
             self._fake_muse_active = True
             self._fake_muse = eeg_data_thread
 
-        self.data_stream.lsl_connect()
+        self._connected = run_in_background(self._connect_streams,
+                                            aux_stream_types)
+        return self._connected
 
-    def start(self):
-        """Start streaming EEG data"""
-        self.data_stream.lsl_start()
+    def _connect_streams(self, aux_stream_types):
+        """Connects to the EEG stream and the given auxiliary streams"""
+        self.data_stream.lsl_connect(max_chunklen=self.chunk_size)
 
-        # wait until the channels are set up
-        while len(self.data_stream.list_channels()) == 0:
-            time.sleep(0.01)
-        channel_name = self.data_stream.list_channels()[0]
+        for stream_type in aux_stream_types:
+            data_stream = DataStream()
+            data_stream.lsl_connect(max_chunklen=self.chunk_size,
+                                    stream_type=stream_type)
+            self.data_streams[stream_type] = data_stream
 
-        # wait until there is data in the channels
-        while not self.data_stream.has_data(channel_name):
-            time.sleep(0.01)
-        self.time_diff = time.time() - \
-                         self.data_stream.get_latest_data(channel_name)[0]
+    def start(self):
+        """
+        Start streaming EEG data (and data from other connected streams) once
+        the muse is connected
+
+        :return: concurrent.futures.Future that resolves once there is EEG data
+        """
+        return run_in_background(self._start_streams)
+
+    def _start_streams(self):
+        """Waits for the connection, starts reading and waits for data"""
+        if self._connected is None:
+            raise RuntimeError("Muse is not connected")
+        self._connected.result()
+
+        if self.ingest_process:
+            for data_stream in self.data_streams.values():
+                data_stream.lsl_start_process(chunk_size=self.chunk_size,
+                                              chunk_timeout=self.chunk_timeout)
+        else:
+            self._reader = LSLReader(chunk_size=self.chunk_size,
+                                     chunk_timeout=self.chunk_timeout)
+            for data_stream in self.data_streams.values():
+                self._reader.add(data_stream)
+            self._reader.start()
+
+        self.data_stream.data_ready().result()
 
     def stop(self):
         """Stop streaming EEG data"""
-        self.data_stream.lsl_stop()
+        if self._reader is not None:
+            self._reader.stop()
+            self._reader = None
+
+        if self.ingest_process:
+            for data_stream in self.data_streams.values():
+                data_stream.lsl_stop()
 
     def shutdown(self):
         """Disconnect EEG stream (and stop streaming data)"""
-        self.data_stream.lsl_Stop()
+        self.stop()
         self.data_stream = DataStream()
+        self.data_streams = {'EEG': self.data_stream}
+        self._connected = None
 
     def get_info(self):
         """Print info about device"""
         print("Device ID: " + str(self.device_id))
 
     def get_time_diff(self):
-        """Return time offset"""
-        return self.time_diff
+        """
+        Return difference between unix and muse time. The offset is measured
+        periodically in the background and corrected for clock drift.
+        """
+        return self.data_stream.clock.unix_offset()
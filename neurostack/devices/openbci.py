@@ -1,12 +1,41 @@
 import openbci
+import numpy as np
+import pylsl
 
+from data_streams.data_stream import DataStream
 from devices.device import Device
+from utils import run_in_background
 
 
 class OpenBCI(Device):
 
-    def __init__(self, device_id=None):
-        super().__init__(device_id)
+    # sample rate of the Cyton, halved when a Daisy board is attached
+    SAMPLE_RATE = 250
+
+    def __init__(self, device_id=None, n_channels=8, chunk_size=10):
+        """
+        :param device_id: id of the device
+        :param n_channels: number of EEG channels, 8 for a Cyton or 16 with a
+                           Daisy board
+        :param chunk_size: number of samples collected before they are added
+                           to the data stream at once
+        """
+        # with a Daisy board, the board library merges every two samples into
+        # one of 16 channels. The stream's buffer is sized from the sample
+        # rate, so the board's rate is set before any channel is added.
+        self.daisy = n_channels > 8
+        self.sample_rate = self.SAMPLE_RATE / 2 if self.daisy \
+            else self.SAMPLE_RATE
+        super().__init__(device_id, DataStream(sample_rate=self.sample_rate))
+
+        self.chunk_size = chunk_size
+        self.channel_names = [f"EEG{i}" for i in range(n_channels)]
+        self.openbci_cyton = None
+        self._connected = None
+
+        # samples received since the last chunk was added
+        self._timestamps = []
+        self._samples = []
 
     @staticmethod
     def available_devices():
@@ -26,23 +55,61 @@ class OpenBCI(Device):
 
         pass  # OpenBCICyton does it internally
 
+    def _on_sample(self, sample):
+        """
+        Called by the board for every sample. Samples are collected and added
+        to the data stream in chunks.
+
+        :param sample: OpenBCISample, with channel_data in microvolts
+        :return: None
+        """
+        self._timestamps.append(pylsl.local_clock())
+        self._samples.append(sample.channel_data)
+        if len(self._timestamps) < self.chunk_size:
+            return
+
+        timestamps, samples = self._timestamps, self._samples
+        self._timestamps, self._samples = [], []
+        self.data_stream.add_chunk(timestamps, np.array(samples),
+                                   self.channel_names)
+
     def connect(self, device_id=None):
         """
         Connect to EEG device with id specified. If id is not specified,
         connect to randomly selected EEG device.
 
         :param device_id:
-        :return:
+        :return: concurrent.futures.Future that resolves once the board is
+                 connected
         """
-        self.openbci_cyton = openbci.OpenBCICyton()
+        self.data_stream.declare_stream(self.channel_names)
+
+        def connect_board():
+            # scaled_output has the board library convert counts to
+            # microvolts
+            self.openbci_cyton = openbci.OpenBCICyton(daisy=self.daisy,
+                                                      scaled_output=True)
 
-    def start(self) -> None:
+        self._connected = run_in_background(connect_board)
+        return self._connected
+
+    def start(self):
         """
         Start streaming EEG from device, and publish data to subscribers.
     
-        :return:
+        :return: concurrent.futures.Future that resolves once there is data
         """
-        self.openbci_cyton.start_streaming(callback)
+        return run_in_background(self._start_streaming)
+
+    def _start_streaming(self):
+        """Waits for the connection, starts streaming and waits for data"""
+        if self._connected is None:
+            raise RuntimeError("OpenBCI board is not connected")
+        self._connected.result()
+
+        # start_streaming blocks while the board streams
+        run_in_background(self.openbci_cyton.start_streaming, self._on_sample)
+        self.data_stream.data_ready().result()
 
     def stop(self) -> None:
         """
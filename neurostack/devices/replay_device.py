@@ -0,0 +1,195 @@
+"""
+Device that replays a recorded Session through its DataStream, in real time,
+N times faster, or as fast as possible. Markers of the session are added to
+the stream and passed to a callback when the replay reaches them, so the full
+training and prediction path can be run on recorded data.
+"""
+import concurrent.futures
+import threading
+import time
+
+import numpy as np
+import pylsl
+
+from data_streams.data_stream import DataStream
+from devices import Device
+from utils import generate_uuid, resolved_future, run_in_background
+
+
+class ReplayDevice(Device):
+
+    def __init__(self, session, device_id=None, speed=1., chunk_size=32,
+                 preserve_timestamps=True, on_marker=None,
+                 buffer_seconds=60):
+        """
+        :param session: Session to replay, or a reader of a session file such
+                        as EDFReader or XDFReader
+        :param device_id: id of the device
+        :param speed: playback speed, e.g. 1 for real time or 10 for ten times
+                      faster. If None, replay as fast as possible.
+        :param chunk_size: number of frames written at once
+        :param preserve_timestamps: if True, frames keep the timestamps of the
+                                    recording. If False, timestamps are shifted
+                                    so that the replay starts now.
+        :param on_marker: function called with (timestamp, label) for every
+                          marker of the session, once the frames up to the
+                          marker have been written. Markers are also added to
+                          the data stream.
+        :param buffer_seconds: number of seconds of data kept in memory
+        """
+        sample_rate = session.sample_rate if session.sample_rate > 0 else 256
+        super().__init__(device_id if device_id is not None
+                         else generate_uuid(),
+                         DataStream(buffer_seconds=buffer_seconds,
+                                    sample_rate=sample_rate))
+
+        self.session = session
+        self.speed = speed
+        self.chunk_size = chunk_size
+        self.preserve_timestamps = preserve_timestamps
+        self.on_marker = on_marker
+
+        # (timestamp, label) of the markers replayed so far
+        self.markers = []
+
+        # number of frames replayed so far
+        self.replayed_frames = 0
+
+        self._replay_thread = None
+        self._active = False
+        self._finished = concurrent.futures.Future()
+
+    #
+    # Replaying
+    #
+
+    def _replay_until_error(self):
+        """Runs the replay, resolving finished() with its outcome"""
+        try:
+            self._replay()
+        except Exception as e:
+            print(f"Replay of {self.device_id} stopped: {e}")
+            self._finished.set_exception(e)
+        else:
+            self._finished.set_result(self.replayed_frames)
+        finally:
+            self._active = False
+
+    def _replay(self):
+        """
+        Writes the session's frames and fires its markers, sleeping between
+        chunks when replaying at a given speed
+
+        :return: None
+        """
+        session = self.session
+        first = None
+        offset = 0.
+
+        marker = 0
+        for timestamps, data in session.iter_chunks(self.chunk_size):
+            if not self._active:
+                break
+
+            if first is None:
+                first = timestamps[0]
+                if not self.preserve_timestamps:
+                    offset = pylsl.local_clock() - first
+                wall_start = time.perf_counter()
+
+            if self.speed is not None:
+                due = wall_start + (timestamps[-1] - first) / self.speed
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+
+            self.data_stream.add_chunk(timestamps + offset, data,
+                                       self.session.channel_names)
+            self.replayed_frames += len(timestamps)
+
+            # markers up to the last frame written
+            end = np.searchsorted(session.marker_timestamps, timestamps[-1],
+                                  side='right')
+            marker = self._fire_markers(marker, end, offset)
+
+        if self._active:
+            self._fire_markers(marker, len(session.marker_timestamps), offset)
+
+    def _fire_markers(self, start, end, offset):
+        """Passes the session's markers [start, end) on, returns end"""
+        for i in range(start, end):
+            marker = (float(self.session.marker_timestamps[i] + offset),
+                      self.session.marker_labels[i])
+            self.markers.append(marker)
+            self.data_stream.add_marker(*marker)
+            if self.on_marker is not None:
+                self.on_marker(*marker)
+        return end
+
+    def finished(self):
+        """
+        Returns a concurrent.futures.Future that resolves to the number of
+        replayed frames once the replay has finished or was stopped, or fails
+        with the exception that stopped it
+        """
+        return self._finished
+
+    #
+    # Public device methods
+    #
+
+    def connect(self):
+        """
+        Creates the channels of the data stream
+
+        :return: concurrent.futures.Future that is already resolved
+        """
+        self.data_stream.declare_stream(self.session.channel_names,
+                                        self.session.stream_type)
+        return resolved_future()
+
+    def start(self):
+        """
+        Start replaying the session in a background thread
+
+        :return: concurrent.futures.Future that resolves once there is data,
+                 or fails if the replay stops before there is any
+        """
+        self._active = True
+        self._replay_thread = threading.Thread(
+            target=self._replay_until_error, name='replay')
+        self._replay_thread.daemon = True
+        self._replay_thread.start()
+
+        return run_in_background(self._wait_for_data, self._finished)
+
+    def stop(self):
+        """Stop replaying"""
+        self._active = False
+        if self._replay_thread is not None:
+            self._replay_thread.join()
+            self._replay_thread = None
+
+    def join(self, timeout=None):
+        """
+        Blocks until the replay has finished
+
+        :param timeout: maximum number of seconds to wait
+        :return: True if the replay has finished, False on timeout
+        """
+        if self._replay_thread is not None:
+            self._replay_thread.join(timeout)
+        return self._finished.done()
+
+    def shutdown(self):
+        """Stop replaying and free the data stream's storage"""
+        self.stop()
+        self.data_stream.close()
+
+    def get_info(self):
+        """Print info about device"""
+        speed = "as fast as possible" if self.speed is None \
+            else f"at {self.speed:g}x"
+        print(f"Device ID: {self.device_id}, replaying "
+              f"{self.session.duration:.1f} s of "
+              f"{len(self.session.channel_names)} channels {speed}")
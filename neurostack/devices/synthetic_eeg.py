@@ -0,0 +1,246 @@
+"""
+Synthetic EEG for fake devices. Samples are generated in NumPy blocks with a
+1/f background, an alpha rhythm and optional P300 and event-related
+desynchronisation (ERD) events, and pushed to an LSL outlet on a deadline
+schedule, so the stream runs at exactly its nominal rate on average no matter
+how much the process oversleeps.
+"""
+import threading
+import time
+
+import numpy as np
+import pylsl
+
+
+class SyntheticEEG:
+
+    def __init__(self, n_channels=4, sample_rate=256, noise_amplitude=10.,
+                 exponent=1., alpha_amplitude=5., alpha_frequency=10.,
+                 seed=None):
+        """
+        Initializes a generator
+
+        :param n_channels: number of channels
+        :param sample_rate: number of samples per second
+        :param noise_amplitude: standard deviation of the 1/f background, in
+                                microvolts
+        :param exponent: exponent of the background's power spectrum, which
+                         falls off as 1/f^exponent
+        :param alpha_amplitude: amplitude of the alpha rhythm, in microvolts
+        :param alpha_frequency: frequency of the alpha rhythm, in Hz
+        :param seed: seed of the random number generator
+        """
+        self.n_channels = n_channels
+        self.sample_rate = float(sample_rate)
+        self.noise_amplitude = noise_amplitude
+        self.alpha_amplitude = alpha_amplitude
+        self.alpha_frequency = alpha_frequency
+
+        self._rng = np.random.default_rng(seed)
+
+        # sequence number of the next sample to generate
+        self.seq = 0
+
+        # LSL time of sample 0 while pushing to an outlet
+        self.start_time = None
+
+        # the background is shaped in the frequency domain, one block of
+        # at least 8 seconds at a time. Consecutive blocks are crossfaded.
+        self._block_size = int(2 ** np.ceil(np.log2(8 * self.sample_rate)))
+        self._fade = self._block_size // 8
+        frequencies = np.fft.rfftfreq(self._block_size, 1 / self.sample_rate)
+        frequencies[0] = frequencies[1]
+        self._spectrum = frequencies ** (-exponent / 2)
+        self._spectrum /= np.sqrt(np.mean(self._spectrum ** 2))
+
+        # equal-power crossfade, since consecutive blocks are uncorrelated
+        ramp = np.linspace(0, np.pi / 2, self._fade)[:, np.newaxis]
+        self._fade_in = np.sin(ramp)
+        self._fade_out = np.cos(ramp)
+
+        self._noise = np.empty((0, n_channels))
+        self._noise_tail = None
+
+        self._alpha_phase = self._rng.uniform(0, 2 * np.pi, n_channels)
+
+        # (kind, sequence number, parameters) of injected events. Events can
+        # be injected from other threads while samples are generated.
+        self.events = []
+        self._events_lock = threading.Lock()
+
+    #
+    # Events
+    #
+
+    def inject_p300(self, seq=None, amplitude=8., latency=0.3, width=0.05):
+        """
+        Injects a P300: a positive deflection on all channels, peaking some
+        time after the stimulus
+
+        :param seq: sequence number of the stimulus. If None, the next sample.
+        :param amplitude: peak amplitude, in microvolts
+        :param latency: number of seconds between stimulus and peak
+        :param width: standard deviation of the peak, in seconds
+        :return: sequence number of the stimulus
+        """
+        seq = self.seq if seq is None else seq
+        with self._events_lock:
+            self.events.append(('p300', seq, {'amplitude': amplitude,
+                                              'latency': latency,
+                                              'width': width}))
+        return seq
+
+    def inject_erd(self, seq=None, duration=2., depth=0.8, channels=None):
+        """
+        Injects an event-related desynchronisation: the alpha rhythm is
+        suppressed for some time, as during motor imagery
+
+        :param seq: sequence number of the start. If None, the next sample.
+        :param duration: number of seconds of suppression
+        :param depth: fraction of the alpha amplitude that is suppressed
+        :param channels: indices of the affected channels. If None, all
+                         channels.
+        :return: sequence number of the start
+        """
+        seq = self.seq if seq is None else seq
+        with self._events_lock:
+            self.events.append(('erd', seq, {'duration': duration,
+                                             'depth': depth,
+                                             'channels': channels}))
+        return seq
+
+    def seq_at(self, timestamp):
+        """Returns the sequence number of the sample pushed at an LSL time"""
+        return int(round((timestamp - self.start_time) * self.sample_rate))
+
+    def time_of(self, seq):
+        """Returns the LSL timestamp of a pushed sample"""
+        return self.start_time + seq / self.sample_rate
+
+    #
+    # Generating samples
+    #
+
+    def _noise_block(self):
+        """Returns a block of 1/f noise of shape (block size, channels)"""
+        white = self._rng.standard_normal((self._block_size, self.n_channels))
+        spectrum = np.fft.rfft(white, axis=0) * self._spectrum[:, np.newaxis]
+        return np.fft.irfft(spectrum, n=self._block_size, axis=0) * \
+            self.noise_amplitude
+
+    def _background(self, n):
+        """Returns the next n samples of 1/f noise"""
+        while len(self._noise) < n:
+            block = self._noise_block()
+            if self._noise_tail is not None:
+                block[:self._fade] = self._noise_tail * self._fade_out + \
+                    block[:self._fade] * self._fade_in
+            self._noise = np.concatenate([self._noise, block[:-self._fade]])
+            self._noise_tail = block[-self._fade:]
+
+        noise = self._noise[:n]
+        self._noise = self._noise[n:]
+        return noise
+
+    def generate(self, n):
+        """
+        Generates the next n samples
+
+        :param n: number of samples
+        :return: array of shape (n, channels), in microvolts
+        """
+        seqs = self.seq + np.arange(n)
+        t = seqs[:, np.newaxis] / self.sample_rate
+
+        # alpha waxes and wanes over a few seconds
+        envelope = 1 + 0.5 * np.sin(2 * np.pi * 0.1 * t + self._alpha_phase)
+        alpha_amplitude = self.alpha_amplitude * envelope
+        erp = np.zeros((n, 1))
+
+        end = self.seq + n
+        with self._events_lock:
+            injected = self.events
+            self.events = []
+
+        events = []
+        for kind, start, parameters in injected:
+            if kind == 'p300':
+                peak = start + parameters['latency'] * self.sample_rate
+                width = parameters['width'] * self.sample_rate
+                if end <= peak - 4 * width:
+                    events.append((kind, start, parameters))
+                    continue
+                erp[:, 0] += parameters['amplitude'] * \
+                    np.exp(-0.5 * ((seqs - peak) / width) ** 2)
+                if end < peak + 4 * width:
+                    events.append((kind, start, parameters))
+            else:
+                stop = start + int(parameters['duration'] * self.sample_rate)
+                if end <= start:
+                    events.append((kind, start, parameters))
+                    continue
+                rows = slice(max(start - self.seq, 0), max(stop - self.seq, 0))
+                columns = slice(None) if parameters['channels'] is None else \
+                    parameters['channels']
+                alpha_amplitude[rows, columns] *= 1 - parameters['depth']
+                if end < stop:
+                    events.append((kind, start, parameters))
+
+        with self._events_lock:
+            self.events = events + self.events
+
+        alpha = alpha_amplitude * \
+            np.sin(2 * np.pi * self.alpha_frequency * t + self._alpha_phase)
+
+        self.seq = end
+        return self._background(n) + alpha + erp
+
+    #
+    # Streaming
+    #
+
+    def push_due(self, outlet, chunk_size=1):
+        """
+        Pushes all samples that are due to an LSL outlet. Every sample is due
+        at start_time + seq / sample_rate, so pushing late delays samples but
+        never drops them or lowers the rate. The first call sets start_time.
+
+        :param outlet: pylsl.StreamOutlet
+        :param chunk_size: minimum number of due samples to push
+        :return: number of samples pushed
+        """
+        if self.start_time is None:
+            self.start_time = pylsl.local_clock() - \
+                self.seq / self.sample_rate
+
+        due = int((pylsl.local_clock() - self.start_time) *
+                  self.sample_rate) - self.seq
+        if due < chunk_size:
+            return 0
+
+        chunk = self.generate(due).astype(np.float32)
+        outlet.push_chunk(chunk, self.time_of(self.seq - 1))
+        return due
+
+    def next_deadline(self, chunk_size=1):
+        """Returns the LSL time at which chunk_size more samples are due"""
+        return self.time_of(self.seq + chunk_size)
+
+    def push_to(self, outlet, chunk_size, is_active):
+        """
+        Pushes samples to an LSL outlet in chunks until is_active returns
+        False, sleeping until each chunk is due
+
+        :param outlet: pylsl.StreamOutlet
+        :param chunk_size: number of samples to push at once
+        :param is_active: function that returns False once pushing should stop
+        :return: None
+        """
+        self.start_time = None
+        self.push_due(outlet, chunk_size)
+
+        while is_active():
+            wait = self.next_deadline(chunk_size) - pylsl.local_clock()
+            if wait > 0:
+                time.sleep(wait)
+            self.push_due(outlet, chunk_size)
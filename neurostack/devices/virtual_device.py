@@ -0,0 +1,302 @@
+"""
+Virtual EEG devices for load testing. A virtual device publishes synthetic EEG
+through an LSL outlet and records it back like a real device, so ingest,
+storage and fan-out can be measured without hardware. A VirtualDeviceFarm runs
+many virtual devices in one process, with one thread generating the data of
+all devices and one LSLReader ingesting it.
+"""
+import threading
+import time
+
+import pylsl
+
+from data_streams.data_stream import DataStream
+from data_streams.lsl_reader import LSLReader
+from data_streams.stream_discovery import get_stream_discovery
+from devices import Device
+from devices.synthetic_eeg import SyntheticEEG
+from utils import generate_uuid, run_in_background
+
+
+class VirtualDevice(Device):
+
+    def __init__(self, device_id=None, n_channels=8, sample_rate=256,
+                 chunk_size=32, chunk_timeout=0.1, buffer_seconds=60,
+                 seed=None, farm=None):
+        """
+        :param device_id: id of the device
+        :param n_channels: number of EEG channels
+        :param sample_rate: number of samples per second
+        :param chunk_size: number of samples pushed and pulled at once
+        :param chunk_timeout: maximum number of seconds to wait for a chunk
+        :param buffer_seconds: number of seconds of data kept in memory
+        :param seed: seed of the synthetic EEG
+        :param farm: VirtualDeviceFarm that generates and reads the data of
+                     this device. If None, the device uses threads of its own.
+        """
+        super().__init__(device_id if device_id is not None
+                         else generate_uuid(),
+                         DataStream(buffer_seconds=buffer_seconds,
+                                    sample_rate=sample_rate))
+
+        self.chunk_size = chunk_size
+        self.chunk_timeout = chunk_timeout
+        self.generator = SyntheticEEG(n_channels=n_channels,
+                                      sample_rate=sample_rate, seed=seed)
+        self.outlet = None
+
+        self._farm = farm
+        self._connected = None
+        self._active = False
+        self._push_thread = None
+        self._reader = None
+
+    @property
+    def n_channels(self):
+        return self.generator.n_channels
+
+    @property
+    def sample_rate(self):
+        return self.generator.sample_rate
+
+    #
+    # Public device methods
+    #
+
+    def connect(self):
+        """
+        Opens the device's LSL outlet and connects its data stream to it in
+        the background
+
+        :return: concurrent.futures.Future that resolves once the data stream
+                 is connected
+        """
+        source_id = f"virtual-{self.device_id}"
+        info = pylsl.StreamInfo(name=f"Virtual {self.device_id}", type='EEG',
+                                channel_count=self.n_channels,
+                                nominal_srate=self.sample_rate,
+                                channel_format='float32', source_id=source_id)
+        channels = info.desc().append_child('channels')
+        for i in range(self.n_channels):
+            channels.append_child("channel") \
+                .append_child_value("label", f"EEG{i}") \
+                .append_child_value("unit", "microvolts") \
+                .append_child_value("type", "EEG")
+        self.outlet = pylsl.StreamOutlet(info, chunk_size=self.chunk_size)
+
+        def connect_stream():
+            stream_info = get_stream_discovery().find(source_id=source_id) \
+                .result()
+            self.data_stream.lsl_connect(max_chunklen=self.chunk_size,
+                                         stream_info=stream_info)
+
+        self._connected = run_in_background(connect_stream)
+        return self._connected
+
+    def start(self):
+        """
+        Start generating data and recording it once the device is connected
+
+        :return: concurrent.futures.Future that resolves once there is data
+        """
+        return run_in_background(self._start_streaming)
+
+    def _start_streaming(self):
+        """Waits for the connection, starts streaming and waits for data"""
+        if self._connected is None:
+            raise RuntimeError("Virtual device is not connected")
+        self._connected.result()
+
+        self.generator.start_time = None
+        self._active = True
+
+        if self._farm is not None:
+            self._farm._reader.add(self.data_stream)
+        else:
+            self._push_thread = threading.Thread(
+                target=self.generator.push_to,
+                args=(self.outlet, self.chunk_size, lambda: self._active),
+                name=f"virtual device {self.device_id}")
+            self._push_thread.daemon = True
+            self._push_thread.start()
+
+            self._reader = LSLReader(chunk_size=self.chunk_size,
+                                     chunk_timeout=self.chunk_timeout)
+            self._reader.add(self.data_stream)
+            self._reader.start()
+
+        self.data_stream.data_ready().result()
+
+    def stop(self):
+        """Stop generating and recording data"""
+        self._active = False
+        self._push_thread = None
+
+        if self._reader is not None:
+            self._reader.stop()
+            self._reader = None
+
+    def shutdown(self):
+        """Stop streaming and close the outlet"""
+        self.stop()
+        self.data_stream.close()
+        self.outlet = None
+        self._connected = None
+
+    def get_info(self):
+        """Print info about device"""
+        print(f"Device ID: {self.device_id}, {self.n_channels} channels at "
+              f"{self.sample_rate:g} Hz")
+
+    #
+    # Load measurement
+    #
+
+    def produced_samples(self):
+        """Returns the number of samples pushed to the outlet"""
+        return self.generator.seq
+
+    def ingested_samples(self):
+        """Returns the number of samples written to the data stream"""
+        return self.data_stream.get_sequence_number()
+
+
+class VirtualDeviceFarm:
+
+    def __init__(self, n_devices, n_channels=8, sample_rate=256,
+                 chunk_size=32, chunk_timeout=0.1, buffer_seconds=60,
+                 idle_sleep=0.001):
+        """
+        Creates virtual devices. Pass farm.devices to Neurostack to serve them.
+
+        :param n_devices: number of virtual devices
+        :param n_channels: number of channels of every device, or a list with
+                           the number of channels of each device
+        :param sample_rate: sample rate of every device, or a list with the
+                            sample rate of each device
+        :param chunk_size: number of samples pushed and pulled at once
+        :param chunk_timeout: maximum number of seconds to wait for a chunk
+        :param buffer_seconds: number of seconds of data each device keeps in
+                               memory
+        :param idle_sleep: number of seconds the reader sleeps when no device
+                           had new data
+        """
+        if not isinstance(n_channels, (list, tuple)):
+            n_channels = [n_channels] * n_devices
+        if not isinstance(sample_rate, (list, tuple)):
+            sample_rate = [sample_rate] * n_devices
+        if len(n_channels) != n_devices or len(sample_rate) != n_devices:
+            raise ValueError("Need a channel count and sample rate for every "
+                             "device")
+
+        self.chunk_size = chunk_size
+        self.devices = [VirtualDevice(device_id=f"virtual{i}",
+                                      n_channels=n_channels[i],
+                                      sample_rate=sample_rate[i],
+                                      chunk_size=chunk_size,
+                                      chunk_timeout=chunk_timeout,
+                                      buffer_seconds=buffer_seconds, seed=i,
+                                      farm=self)
+                        for i in range(n_devices)]
+
+        self._reader = LSLReader(chunk_size=chunk_size,
+                                 chunk_timeout=chunk_timeout,
+                                 idle_sleep=idle_sleep)
+        self._push_thread = None
+        self._active = False
+        self._start_time = None
+
+    def connect(self):
+        """
+        Connects all devices at the same time
+
+        :return: concurrent.futures.Future that resolves once all devices are
+                 connected
+        """
+        connected = [device.connect() for device in self.devices]
+        return run_in_background(
+            lambda: [future.result() for future in connected])
+
+    def start(self):
+        """
+        Starts the generating thread and the reader, then starts all devices
+
+        :return: concurrent.futures.Future that resolves once all devices have
+                 data
+        """
+        self._active = True
+        self._start_time = time.time()
+        self._push_thread = threading.Thread(target=self._push_indefinitely,
+                                             name='virtual device farm')
+        self._push_thread.daemon = True
+        self._push_thread.start()
+        self._reader.start()
+
+        started = [device.start() for device in self.devices]
+        return run_in_background(
+            lambda: [future.result() for future in started])
+
+    def stop(self):
+        """Stops generating and reading data of all devices"""
+        for device in self.devices:
+            device.stop()
+        self._active = False
+        self._push_thread = None
+        self._reader.stop()
+
+    def shutdown(self):
+        """Stops all devices and closes their outlets"""
+        self.stop()
+        for device in self.devices:
+            device.shutdown()
+
+    def _push_indefinitely(self):
+        """
+        Pushes the due samples of every started device, then sleeps until the
+        next chunk of any device is due
+
+        :return: None
+        """
+        while self._active:
+            active = [device for device in self.devices if device._active]
+            for device in active:
+                device.generator.push_due(device.outlet, self.chunk_size)
+
+            if not active:
+                time.sleep(0.01)
+                continue
+
+            deadline = min(device.generator.next_deadline(self.chunk_size)
+                           for device in active)
+            wait = deadline - pylsl.local_clock()
+            if wait > 0:
+                time.sleep(wait)
+
+    def report(self):
+        """
+        Returns the load produced and ingested since start
+
+        :return: dict with the number of seconds since start, totals, and the
+                 counts of every device by id
+        """
+        elapsed = time.time() - self._start_time if self._start_time else 0.
+        devices = {}
+        for device in self.devices:
+            devices[device.device_id] = {
+                'channels': device.n_channels,
+                'sample_rate': device.sample_rate,
+                'produced_samples': device.produced_samples(),
+                'ingested_samples': device.ingested_samples(),
+            }
+
+        produced = sum(d['produced_samples'] * d['channels']
+                       for d in devices.values())
+        ingested = sum(d['ingested_samples'] * d['channels']
+                       for d in devices.values())
+        return {
+            'seconds': elapsed,
+            'produced_values': produced,
+            'ingested_values': ingested,
+            'ingested_values_per_second': ingested / elapsed if elapsed else 0.,
+            'devices': devices,
+        }
@@ -7,7 +7,6 @@ import argparse
 import asyncio
 import json
 import socketio
-import time
 
 
 class Neurostack:
@@ -40,6 +39,8 @@ class Neurostack:
     def start(self, list_of_devices=None):
         """
         Start streaming EEG from device, and publish data to subscribers.
+        Devices start at the same time, and this returns once all of them have
+        data.
 
         :param list_of_devices: [Device] List of devices to start streaming. If none, all devices will start streaming.
 
@@ -50,8 +51,9 @@ class Neurostack:
         else:
             devices_to_start = list_of_devices
 
-        for device in devices_to_start:
-            device.start()
+        started = [device.start() for device in devices_to_start]
+        for future in started:
+            future.result()
 
     def stop(self, list_of_devices=None):
         """
@@ -207,24 +209,28 @@ class Neurostack:
         uuid = args['uuid']
         self.stream_raw_data[uuid] = True
 
-        # keep track of data from previous while loop iteration, so that the
-        # same data is not sent twice.
-        prev_data = None
-        while self.stream_raw_data[uuid]:
+        # TODO: devices[0] is the Muse that we set at the bottom, but we
+        # want to support multiple or different devices
+        data_stream = self.devices[0].data_stream
+        eeg_channel_names = data_stream.get_eeg_channels()
 
-            # TODO: devices[0] is the Muse that we set at the bottom, but we
-            # want to support multiple or different devices
-            data_stream = self.devices[0].data_stream
-            eeg_channel_names = data_stream.get_eeg_channels()
-            raw_data = data_stream.get_latest_data(eeg_channel_names)
+        # the cursor keeps track of which data has been sent already, so that
+        # no data is skipped or sent twice
+        cursor = data_stream.subscribe()
+        while self.stream_raw_data[uuid]:
 
-            # TODO: raw data can be either a list or a dict right now, should we
-            # just stick with dict?
+            # wait for new data without blocking the event loop
+            has_data = await cursor.wait_async(timeout=0.1)
+            if not has_data:
+                continue
 
-            # in case while loop is running faster than device streaming rate
-            if raw_data != prev_data:
-                prev_data = raw_data
-                await self.sio_app.emit('raw_data', raw_data)
+            timestamps, data = cursor.read(eeg_channel_names)
+            raw_data = {
+                'timestamps': timestamps.tolist(),
+                'data': {channel: data[:, i].tolist()
+                         for i, channel in enumerate(eeg_channel_names)}
+            }
+            await self.sio_app.emit('raw_data', raw_data)
 
     async def stop_streaming_raw_data_handler(self, sid, args):
         """
@@ -302,16 +308,26 @@ class Neurostack:
         # TODO: change API to specify device
         device = self.devices[0]
 
-        # Wait until the device has enough data (ie. the time slice is complete)
-        # then take 100ms - 750ms window for training
-        while time.time() < timestamp + window:
-            time.sleep(.01)
-
+        # Mark the stimulus, wait until the device has enough data (ie. the
+        # time slice is complete) then take 128 samples from 100ms on for
+        # training
         # TODO: num_samples = window * sample rate
-        timestamp -= self.devices[0].get_time_diff()
-        data_dict = device.data_stream.get_eeg_data(start_time=timestamp + .1,
-                                                    num_samples=128)
-        data = list(data_dict.values())
+        data_stream = device.data_stream
+        timestamp = data_stream.unix_to_lsl(timestamp)
+        data_stream.add_marker(timestamp, label)
+        try:
+            await data_stream.wait_until(timestamp + window,
+                                         timeout=window + 1)
+        except asyncio.TimeoutError:
+            await self.sio_app.emit("train", {
+                'uuid': uuid,
+                'error': "No data from the device for the training window"
+            })
+            return
+
+        epochs = data_stream.get_epochs(
+            [timestamp], tmin=.1, tmax=.1 + 128 / data_stream.sample_rate)
+        data = epochs[0].tolist()
 
         self.send_train_data(
             server_endpoint=server_endpoint,
@@ -322,7 +338,7 @@ class Neurostack:
 
         # wait for results
         while len(self.train_results[uuid]) == 0:
-            time.sleep(.01)
+            await asyncio.sleep(.01)
         result = self.train_results[uuid].pop(0)
         await self.sio_app.emit("train", result)
 
@@ -348,13 +364,21 @@ class Neurostack:
         # Wait until the device has enough data (ie. the time slice is complete)
         # then take 100ms - 750ms window for training. The window should
         # contain 0.65s * 256Hz = 166 samples.
-        while time.time() < timestamp + window:
-            time.sleep(.01)
-
-        timestamp -= self.devices[0].get_time_diff()
-        data_dict = device.data_stream.get_eeg_data(start_time=timestamp + .1,
-                                                    num_samples=128)
-        data = list(data_dict.values())
+        data_stream = device.data_stream
+        timestamp = data_stream.unix_to_lsl(timestamp)
+        try:
+            await data_stream.wait_until(timestamp + window,
+                                         timeout=window + 1)
+        except asyncio.TimeoutError:
+            await self.sio_app.emit("predict", {
+                'uuid': uuid,
+                'error': "No data from the device for the prediction window"
+            })
+            return
+
+        epochs = data_stream.get_epochs(
+            [timestamp], tmin=.1, tmax=.1 + 128 / data_stream.sample_rate)
+        data = epochs[0].tolist()
 
         self.send_predict_data(
             server_endpoint=server_endpoint,
@@ -364,7 +388,7 @@ class Neurostack:
 
         # wait for results
         while len(self.predict_results[uuid]) == 0:
-            time.sleep(.01)
+            await asyncio.sleep(.01)
         result = self.predict_results[uuid].pop(0)
         await self.sio_app.emit("predict", result)
 
@@ -433,7 +457,7 @@ if __name__ == '__main__':
     # TODO: add something to specify which devices get passed in
     muse = Muse()
     muse.connect(fake_data=args.use_fake_data)
-    muse.start()
+    muse.start().result()
 
     # create and run neurostack!
     devices = [muse]
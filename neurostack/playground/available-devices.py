@@ -1,10 +1,18 @@
-# pip install pyusb
-import usb
-
-devices = usb.core.find(find_all=True, idVendor=0x0403, idProduct=0x6015)
-for device in devices:
-    print(device)
-    # print(device.idVendor == 0x0403)
-    # print(device.idProduct == 0x6015)
-    # print(device.manufacturer == "FTDI")
-    # print(device.product == "FT231X USB UART")
+"""
+Lists the LSL streams currently on the network, from the cache of the
+background stream discovery
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from data_streams.stream_discovery import get_stream_discovery
+
+discovery = get_stream_discovery()
+discovery.wait_until_refreshed(timeout=5)
+
+for info in discovery.streams():
+    print(f"{info.name()}: type {info.type()}, "
+          f"{info.channel_count()} channels at {info.nominal_srate()} Hz, "
+          f"source id {info.source_id()!r}")
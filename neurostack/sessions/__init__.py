@@ -0,0 +1,4 @@
+from sessions.session import Session
+from sessions.recorder import Recorder, iter_recording, read_recording
+from sessions.edf import EDFReader, EDFWriter, export_edf, write_edf
+from sessions.xdf import XDFReader, XDFWriter, export_xdf, write_xdf
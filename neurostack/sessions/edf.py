@@ -0,0 +1,484 @@
+"""
+Streaming EDF+ import and export. Files are written one data record at a time
+and read through a memory map, so hours of data convert in constant memory.
+Markers are stored as EDF+ annotations.
+
+EDF assumes a regular sample rate: exported frames are stored at the nominal
+rate from the first frame on, and imported frames get the timestamps
+start_time + n / sample_rate.
+
+EDF files hold whole data records, so the last record is padded with zeros
+unless the frames fill whole records. The end of the real frames is stored as
+an END_LABEL annotation, which EDFReader leaves out along with the padding.
+Other EDF readers show it as an annotation and keep the padding; writers can
+leave it out with mark_end=False.
+"""
+import datetime
+import os
+
+import numpy as np
+
+
+ANNOTATIONS_LABEL = 'EDF Annotations'
+
+# prefix of annotation labels used by the file format itself, which markers
+# can't use
+RESERVED_PREFIX = 'neurostack:'
+
+# label of the annotation at the end of the frames, when the last data record
+# is padded
+END_LABEL = RESERVED_PREFIX + 'end of frames'
+
+DIGITAL_MIN = -32768
+DIGITAL_MAX = 32767
+
+
+def _field(value, width):
+    """Formats a header field as left-aligned ASCII of a fixed width"""
+    text = str(value)
+    if len(text) > width:
+        raise ValueError(f"{text!r} does not fit in {width} characters")
+    return text.ljust(width).encode('ascii')
+
+
+def _number(value, width=8):
+    """Formats a number with as many digits as fit in a header field"""
+    for precision in range(width, 0, -1):
+        text = f"{value:.{precision}g}"
+        if len(text) <= width:
+            return _field(text, width)
+    raise ValueError(f"{value} does not fit in {width} characters")
+
+
+class EDFWriter:
+
+    def __init__(self, path, channel_names, sample_rate, start_time=None,
+                 physical_range=(-3276.8, 3276.7), physical_dimension='uV',
+                 record_seconds=1., annotation_bytes=256, mark_end=True):
+        """
+        Creates an EDF+ file. Write frames with write, then call close.
+
+        :param path: path of the file, which is overwritten
+        :param channel_names: list of channel names
+        :param sample_rate: sample rate of all channels
+        :param start_time: unix time of the first frame. If None, now.
+        :param physical_range: (minimum, maximum) of the samples. Samples
+                               outside the range are clipped, and NaN is
+                               stored as 0.
+        :param physical_dimension: unit of the samples
+        :param record_seconds: number of seconds per data record.
+                               sample_rate * record_seconds must be an integer.
+        :param annotation_bytes: number of bytes per data record reserved for
+                                 markers
+        :param mark_end: if True and the last data record is padded, the end
+                         of the frames is stored as an END_LABEL annotation.
+                         If False, the padding reads as frames of zeros.
+        """
+        samples_per_record = sample_rate * record_seconds
+        if abs(samples_per_record - round(samples_per_record)) > 1e-6:
+            raise ValueError("sample_rate * record_seconds must be an integer")
+
+        self.channel_names = list(channel_names)
+        self.sample_rate = float(sample_rate)
+        self.record_seconds = float(record_seconds)
+        self.samples_per_record = int(round(samples_per_record))
+        self.annotation_bytes = annotation_bytes + annotation_bytes % 2
+        self.mark_end = mark_end
+        self.physical_min, self.physical_max = physical_range
+
+        if start_time is None:
+            start_time = datetime.datetime.now().timestamp()
+        self.start_time = start_time
+
+        # the header holds whole seconds, record onsets hold the fraction
+        self._fraction = start_time - int(start_time)
+
+        self.n_records = 0
+        self._pending = np.empty((0, len(self.channel_names)))
+
+        # (onset in seconds from the header's start second, label) of markers
+        # not written yet
+        self._annotations = []
+
+        self._scale = (DIGITAL_MAX - DIGITAL_MIN) / \
+            (self.physical_max - self.physical_min)
+
+        self._file = open(path, 'wb')
+        self._write_header(physical_dimension)
+
+    def _write_header(self, physical_dimension):
+        """Writes the header, with an unknown number of data records"""
+        n_signals = len(self.channel_names) + 1
+        start = datetime.datetime.fromtimestamp(int(self.start_time))
+
+        header = b''.join([
+            _field('0', 8),
+            _field('X X X X', 80),
+            _field(f"Startdate {start.strftime('%d-%b-%Y').upper()} X X X",
+                   80),
+            _field(start.strftime('%d.%m.%y'), 8),
+            _field(start.strftime('%H.%M.%S'), 8),
+            _field(256 * (n_signals + 1), 8),
+            _field('EDF+C', 44),
+            _field(-1, 8),
+            _number(self.record_seconds),
+            _field(n_signals, 4),
+        ])
+
+        labels = self.channel_names + [ANNOTATIONS_LABEL]
+        data_fields = [
+            [_field(label, 16) for label in labels],
+            [_field('', 80)] * n_signals,
+            [_field(physical_dimension, 8)] * (n_signals - 1) +
+            [_field('', 8)],
+            [_number(self.physical_min)] * (n_signals - 1) + [_field(-1, 8)],
+            [_number(self.physical_max)] * (n_signals - 1) + [_field(1, 8)],
+            [_field(DIGITAL_MIN, 8)] * n_signals,
+            [_field(DIGITAL_MAX, 8)] * n_signals,
+            [_field('', 80)] * n_signals,
+            [_field(self.samples_per_record, 8)] * (n_signals - 1) +
+            [_field(self.annotation_bytes // 2, 8)],
+            [_field('', 32)] * n_signals,
+        ]
+        for field in data_fields:
+            header += b''.join(field)
+
+        self._file.write(header)
+
+    def add_annotation(self, onset, label):
+        """
+        Adds a marker
+
+        :param onset: number of seconds between the first frame and the marker
+        :param label: label of the marker
+        :return: None
+        """
+        if str(label).startswith(RESERVED_PREFIX):
+            raise ValueError(f"Marker labels can't start with "
+                             f"{RESERVED_PREFIX!r}")
+
+        # longest record timekeeping and onset, e.g. "+86400.25" twice
+        if len(str(label).encode('utf-8')) + 48 > self.annotation_bytes:
+            raise ValueError(f"Marker {label!r} is too long for "
+                             f"{self.annotation_bytes} annotation bytes")
+        self._annotations.append((self._fraction + float(onset), str(label)))
+
+    def write(self, samples):
+        """
+        Writes frames, in full data records. Frames that do not fill a record
+        are kept until the next write or close.
+
+        :param samples: array of shape (n, channels)
+        :return: None
+        """
+        samples = np.concatenate([self._pending, samples])
+        n_records = len(samples) // self.samples_per_record
+        if n_records == 0:
+            self._pending = samples
+            return
+
+        end = n_records * self.samples_per_record
+        self._write_records(samples[:end])
+        self._pending = samples[end:]
+
+    def _write_records(self, samples, flush=False):
+        """
+        Writes frames that fill a whole number of data records
+
+        :param flush: if True, write markers after the records' end too
+        """
+        digital = (np.nan_to_num(samples) - self.physical_min) * self._scale + \
+            DIGITAL_MIN
+        digital = np.clip(np.round(digital), DIGITAL_MIN, DIGITAL_MAX) \
+            .astype('<i2')
+
+        # (records, samples per record, channels) -> channel by channel
+        n_records = len(samples) // self.samples_per_record
+        records = digital.reshape(n_records, self.samples_per_record, -1) \
+            .transpose(0, 2, 1).reshape(n_records, -1)
+
+        for record in records:
+            self._file.write(record.tobytes())
+            self._file.write(self._annotation_record(flush))
+            self.n_records += 1
+
+    def _annotation_record(self, flush=False):
+        """Returns the annotation bytes of the next data record"""
+        start = self._fraction + self.n_records * self.record_seconds
+        text = f"+{start:.6f}\x14\x14\x00".encode()
+
+        # markers up to the end of this record, as many as fit
+        end = start + self.record_seconds
+        remaining = []
+        for onset, label in self._annotations:
+            annotation = f"{onset:+.6f}\x14{label}\x14\x00".encode('utf-8')
+            if (onset < end or flush) and \
+                    len(text) + len(annotation) <= self.annotation_bytes:
+                text += annotation
+            else:
+                remaining.append((onset, label))
+        self._annotations = remaining
+
+        return text.ljust(self.annotation_bytes, b'\x00')
+
+    def close(self):
+        """
+        Writes the last frames, padding the last data record with zeros, and
+        the number of data records
+
+        :return: None
+        """
+        if len(self._pending) > 0:
+            if self.mark_end:
+                n_frames = self.n_records * self.samples_per_record + \
+                    len(self._pending)
+                self._annotations.append(
+                    (self._fraction + n_frames / self.sample_rate, END_LABEL))
+
+            padding = np.zeros((self.samples_per_record - len(self._pending),
+                                len(self.channel_names)))
+            self._write_records(np.concatenate([self._pending, padding]),
+                                flush=True)
+            self._pending = self._pending[:0]
+
+        # markers that did not fit get records of their own
+        while self._annotations:
+            self._write_records(np.zeros((self.samples_per_record,
+                                          len(self.channel_names))),
+                                flush=True)
+
+        self._file.seek(236)
+        self._file.write(_field(self.n_records, 8))
+        self._file.close()
+
+
+class EDFReader:
+
+    def __init__(self, path, start_time=None):
+        """
+        Opens an EDF or EDF+ file whose signals all have the same sample rate.
+        Samples are read through a memory map when they are needed.
+
+        A reader can be replayed like a Session.
+
+        :param path: path of the file
+        :param start_time: timestamp of the first frame. If None, the unix
+                           time of the recording's start.
+        """
+        with open(path, 'rb') as f:
+            header = f.read(256)
+            n_signals = int(header[252:256])
+            signal_header = f.read(256 * n_signals)
+
+        def fields(offset, width):
+            start = n_signals * offset
+            return [signal_header[start + i * width:start + (i + 1) * width]
+                    .decode('ascii').strip() for i in range(n_signals)]
+
+        labels = fields(0, 16)
+        physical_min = np.array(fields(104, 8), dtype=float)
+        physical_max = np.array(fields(112, 8), dtype=float)
+        digital_min = np.array(fields(120, 8), dtype=float)
+        digital_max = np.array(fields(128, 8), dtype=float)
+        samples_per_record = [int(n) for n in fields(216, 8)]
+
+        self.record_seconds = float(header[244:252])
+        header_bytes = int(header[184:192])
+
+        # data records as a structured array, one field per signal
+        record_dtype = np.dtype([(f"s{i}", '<i2', (n,))
+                                 for i, n in enumerate(samples_per_record)])
+        n_records = int(header[236:244])
+        if n_records < 0:
+            n_records = (os.path.getsize(path) - header_bytes) // \
+                record_dtype.itemsize
+        self._records = np.memmap(path, dtype=record_dtype, mode='r',
+                                  offset=header_bytes, shape=(n_records,))
+
+        self._annotation_signal = labels.index(ANNOTATIONS_LABEL) \
+            if ANNOTATIONS_LABEL in labels else None
+        self._signals = [i for i in range(n_signals)
+                         if i != self._annotation_signal]
+        rates = {samples_per_record[i] for i in self._signals}
+        if len(rates) != 1:
+            raise ValueError("All signals must have the same sample rate")
+
+        self.channel_names = [labels[i] for i in self._signals]
+        self.samples_per_record = rates.pop()
+        self.sample_rate = self.samples_per_record / self.record_seconds
+        self.stream_type = 'EEG'
+
+        signals = self._signals
+        self._gain = (physical_max[signals] - physical_min[signals]) / \
+            (digital_max[signals] - digital_min[signals])
+        self._offset = physical_min[signals] - digital_min[signals] * self._gain
+
+        start = datetime.datetime.strptime(
+            (header[168:176] + header[176:184]).decode('ascii'),
+            '%d.%m.%y%H.%M.%S')
+        marker_onsets, marker_labels, start_offset = self._read_annotations()
+        if start_time is None:
+            start_time = start.timestamp() + start_offset
+        self.start_time = start_time
+
+        # frames after the end annotation are padding
+        self._n_frames = len(self._records) * self.samples_per_record
+        if END_LABEL in marker_labels:
+            i = marker_labels.index(END_LABEL)
+            end = marker_onsets.pop(i)
+            marker_labels.pop(i)
+            self._n_frames = min(self._n_frames, int(round(
+                (end - start_offset) * self.sample_rate)))
+
+        self.marker_timestamps = start_time - start_offset + \
+            np.asarray(marker_onsets, dtype=float)
+        self.marker_labels = marker_labels
+
+    def _read_annotations(self):
+        """
+        Reads all markers and the onset of the first data record
+
+        :return: (onsets, labels, start offset), onsets in seconds from the
+                 recording's start
+        """
+        onsets, labels = [], []
+        start_offset = 0.
+        if self._annotation_signal is None:
+            return onsets, labels, start_offset
+
+        field = f"s{self._annotation_signal}"
+        for record in range(len(self._records)):
+            text = self._records[field][record].tobytes()
+            for i, tal in enumerate(text.split(b'\x00')):
+                if not tal:
+                    continue
+                parts = tal.split(b'\x14')
+                onset = float(parts[0].split(b'\x15')[0])
+
+                # the first annotation of every record keeps its time
+                if i == 0 and record == 0:
+                    start_offset = onset
+                for label in parts[1:]:
+                    if label:
+                        onsets.append(onset)
+                        labels.append(label.decode('utf-8'))
+
+        order = np.argsort(onsets, kind='stable')
+        return [onsets[i] for i in order], [labels[i] for i in order], \
+            start_offset
+
+    def __len__(self):
+        return self._n_frames
+
+    @property
+    def duration(self):
+        """Number of seconds between the first and the last frame"""
+        return max(len(self) - 1, 0) / self.sample_rate
+
+    def read(self, start=0, end=None):
+        """
+        Reads a range of frames
+
+        :param start: index of the first frame
+        :param end: index after the last frame. If None, the last frame.
+        :return: (timestamps, data) arrays of shape (n,) and (n, channels)
+        """
+        end = len(self) if end is None else min(end, len(self))
+        start = min(start, end)
+
+        first_record = start // self.samples_per_record
+        last_record = -(-end // self.samples_per_record)
+        records = self._records[first_record:last_record]
+
+        data = np.stack([records[f"s{i}"] for i in self._signals], axis=-1) \
+            .reshape(-1, len(self._signals))
+        offset = first_record * self.samples_per_record
+        data = data[start - offset:end - offset] * self._gain + self._offset
+
+        timestamps = self.start_time + np.arange(start, end) / self.sample_rate
+        return timestamps, data
+
+    def iter_chunks(self, chunk_size):
+        """
+        Iterates over the frames in chunks, reading only the data records of
+        one chunk at a time
+
+        :param chunk_size: maximum number of frames per chunk
+        :return: iterator of (timestamps, data)
+        """
+        for start in range(0, len(self), chunk_size):
+            yield self.read(start, start + chunk_size)
+
+
+def write_edf(path, chunks, channel_names, sample_rate, start_time=None,
+              markers=(), **options):
+    """
+    Writes frames to an EDF+ file, one block at a time
+
+    :param path: path of the file
+    :param chunks: iterator of (timestamps, data) of shape (n,) and
+                   (n, channels)
+    :param channel_names: list of channel names
+    :param sample_rate: sample rate of the frames
+    :param start_time: unix time of the first frame. If None, now.
+    :param markers: list of (timestamp, label), on the clock of the frames'
+                    timestamps
+    :param options: more arguments for EDFWriter
+    :return: number of frames written
+    """
+    writer = None
+    n_frames = 0
+    for timestamps, data in chunks:
+        if len(timestamps) == 0:
+            continue
+        if writer is None:
+            first = timestamps[0]
+            writer = EDFWriter(path, channel_names, sample_rate,
+                               start_time=start_time, **options)
+            for timestamp, label in markers:
+                writer.add_annotation(timestamp - first, label)
+        writer.write(data)
+        n_frames += len(timestamps)
+
+    if writer is None:
+        writer = EDFWriter(path, channel_names, sample_rate,
+                           start_time=start_time, **options)
+    writer.close()
+    return n_frames
+
+
+def export_edf(data_stream, path, channels=None, start_time=None,
+               end_time=None, markers=None, chunk_size=4096, **options):
+    """
+    Exports a time slice of a data stream to an EDF+ file in constant memory
+
+    :param data_stream: DataStream to export
+    :param path: path of the file
+    :param channels: list of channels to export. If None, all channels.
+    :param start_time: start time. If None, start from the oldest data.
+    :param end_time: time to stop at (exclusive). If None, stop at the newest
+                     frame.
+    :param markers: list of (timestamp, label) in the stream's time. If None,
+                    the stream's own markers between start_time and end_time.
+    :param chunk_size: number of frames read from the stream at once
+    :param options: more arguments for EDFWriter
+    :return: number of frames written
+    """
+    channels = data_stream.list_channels() if channels is None else channels
+    if markers is None:
+        markers = list(zip(*data_stream.get_markers(start_time, end_time)))
+    chunks = data_stream.iter_chunks(channels, start_time, end_time,
+                                     chunk_size)
+
+    # the header needs the unix time of the first frame
+    first = next(chunks, None)
+    unix_start = None if first is None else \
+        float(data_stream.lsl_to_unix(first[0][0]))
+
+    def all_chunks():
+        if first is not None:
+            yield first
+            yield from chunks
+
+    return write_edf(path, all_chunks(), channels, data_stream.sample_rate,
+                     start_time=unix_start, markers=markers, **options)
@@ -0,0 +1,320 @@
+"""
+Recording of data streams to disk. A Recorder listens to the frames and
+markers added to a DataStream and hands copies of them to a dedicated writer
+thread through a bounded queue. If the disk falls behind and the queue is full, chunks are
+dropped and counted instead of blocking the thread that ingests the stream.
+
+Recording file format: an 8 byte magic string, a 4 byte little-endian header
+length and a JSON header (channel names, sample dtype, sample rate, stream
+type), followed by blocks. Every block starts with a 1 byte kind and a 4 byte
+frame or marker count:
+
+- data blocks (b'D') hold n float64 timestamps, then the samples channel by
+  channel (n samples of channel 0, n samples of channel 1, ...)
+- marker blocks (b'M') hold n float64 timestamps, then a 4 byte length and a
+  JSON list of n labels
+
+A file cut short by a crash can be read up to its last complete block.
+"""
+import json
+import queue
+import struct
+import threading
+
+import numpy as np
+
+from sessions.session import Session
+
+RECORDING_MAGIC = b'NSREC001'
+DATA_BLOCK = b'D'
+MARKER_BLOCK = b'M'
+
+_LENGTH = struct.Struct('<I')
+_BLOCK_HEADER = struct.Struct('<cI')
+
+
+class Recorder:
+
+    def __init__(self, data_stream, path, channels=None, dtype=np.float32,
+                 block_frames=4096, queue_size=256, flush_interval=1.):
+        """
+        Initializes a recorder. Call start to begin recording.
+
+        :param data_stream: DataStream to record
+        :param path: path of the recording file, which is overwritten
+        :param channels: list of channels to record. If None, all channels of
+                         the stream when recording starts.
+        :param dtype: dtype the samples are stored as
+        :param block_frames: number of frames collected before writing a
+                             block
+        :param queue_size: maximum number of chunks waiting to be written
+        :param flush_interval: number of seconds after which an incomplete
+                               block is written when no new data arrives
+        """
+        self.data_stream = data_stream
+        self.path = path
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.block_frames = block_frames
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._columns = None
+        self._thread = None
+        self._file = None
+
+        # frames and chunks that were dropped because the queue was full
+        self.dropped_frames = 0
+        self.dropped_chunks = 0
+
+        # frames written to the file
+        self.written_frames = 0
+
+        # exception that stopped the writer thread, e.g. a full disk
+        self.error = None
+
+    #
+    # Ingest side, must never block
+    #
+
+    def _on_frames(self, timestamps, samples):
+        """Queues a copy of written frames, runs on the ingest thread"""
+        # indexing the columns copies the samples
+        item = (DATA_BLOCK, np.array(timestamps, dtype=np.float64),
+                samples[:, self._columns].astype(self.dtype))
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.dropped_chunks == 0:
+                print(f"Recorder queue is full, dropping data for {self.path}")
+            self.dropped_chunks += 1
+            self.dropped_frames += len(timestamps)
+
+    def add_marker(self, timestamp, label):
+        """
+        Records a marker. Markers added to the data stream are recorded
+        automatically; use this for markers that are not added to the stream.
+
+        :param timestamp: timestamp of the marker, on the stream's clock
+        :param label: label of the marker
+        :return: None
+        """
+        try:
+            self._queue.put_nowait((MARKER_BLOCK, float(timestamp),
+                                    str(label)))
+        except queue.Full:
+            print(f"Recorder queue is full, dropping marker {label!r}")
+
+    #
+    # Writer thread
+    #
+
+    def start(self):
+        """Opens the file and starts recording in a background thread"""
+        stream = self.data_stream
+        if self.channels is None:
+            self.channels = stream.list_channels()
+        self._columns = [stream.channels[channel]
+                         for channel in self.channels]
+
+        self._file = open(self.path, 'wb')
+        header = json.dumps({
+            'channel_names': self.channels,
+            'dtype': self.dtype.str,
+            'sample_rate': stream.sample_rate,
+            'stream_type': stream.stream_type,
+        }).encode()
+        self._file.write(RECORDING_MAGIC + _LENGTH.pack(len(header)) + header)
+
+        self._thread = threading.Thread(target=self._write_until_error,
+                                        name='recorder')
+        self._thread.daemon = True
+        self._thread.start()
+
+        stream.add_listener(self._on_frames)
+        stream.add_marker_listener(self.add_marker)
+
+    def stop(self):
+        """Stops listening, writes everything queued and closes the file"""
+        self.data_stream.remove_listener(self._on_frames)
+        self.data_stream.remove_marker_listener(self.add_marker)
+        if self._thread is None:
+            return
+
+        # the writer stops at None. If it died, nothing empties the queue.
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+        self._file = None
+
+    def _write_until_error(self):
+        """Runs the writer, keeping the exception if writing fails"""
+        try:
+            self._write_indefinitely()
+        except Exception as e:
+            print(f"Recorder stopped writing {self.path}: {e}")
+            self.error = e
+
+    def _write_indefinitely(self):
+        """
+        Collects queued chunks into blocks and writes them
+
+        :return: None
+        """
+        timestamps, samples = [], []
+        n_frames = 0
+
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+
+            if item is None or item == () or \
+                    (item[0] == DATA_BLOCK and
+                     n_frames + len(item[1]) > self.block_frames):
+                if n_frames > 0:
+                    self._write_data_block(np.concatenate(timestamps),
+                                           np.concatenate(samples))
+                    timestamps, samples = [], []
+                    n_frames = 0
+                if item is None:
+                    break
+                if item == ():
+                    self._file.flush()
+                    continue
+
+            if item[0] == DATA_BLOCK:
+                timestamps.append(item[1])
+                samples.append(item[2])
+                n_frames += len(item[1])
+            else:
+                self._write_marker_block([item[1]], [item[2]])
+
+    def _write_data_block(self, timestamps, samples):
+        """Writes frames as a block of timestamp and sample columns"""
+        self._file.write(_BLOCK_HEADER.pack(DATA_BLOCK, len(timestamps)))
+        self._file.write(timestamps.tobytes())
+        self._file.write(np.asfortranarray(samples).tobytes(order='F'))
+        self.written_frames += len(timestamps)
+
+    def _write_marker_block(self, timestamps, labels):
+        """Writes a block of markers"""
+        encoded = json.dumps(labels).encode()
+        self._file.write(_BLOCK_HEADER.pack(MARKER_BLOCK, len(timestamps)))
+        self._file.write(np.asarray(timestamps, dtype=np.float64).tobytes())
+        self._file.write(_LENGTH.pack(len(encoded)) + encoded)
+
+    def stats(self):
+        """
+        Returns the state of the recording
+
+        :return: dict with the number of written and dropped frames, dropped
+                 chunks, chunks waiting in the queue and the error that
+                 stopped writing, if any
+        """
+        return {
+            'written_frames': self.written_frames,
+            'dropped_frames': self.dropped_frames,
+            'dropped_chunks': self.dropped_chunks,
+            'queued_chunks': self._queue.qsize(),
+            'error': None if self.error is None else str(self.error),
+        }
+
+
+#
+# Reading recordings
+#
+
+def read_recording_header(f):
+    """
+    Reads the header of a recording file
+
+    :param f: file opened in binary mode, at its start
+    :return: dict with channel_names, dtype, sample_rate and stream_type
+    """
+    if f.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+        raise ValueError("Not a recording file")
+    length, = _LENGTH.unpack(f.read(_LENGTH.size))
+    return json.loads(f.read(length).decode())
+
+
+def iter_recording(path):
+    """
+    Iterates over the blocks of a recording file
+
+    :param path: path of the recording file
+    :return: iterator of (kind, timestamps, payload). payload is an array of
+             samples of shape (n, channels) for data blocks, and a list of
+             labels for marker blocks.
+    """
+    with open(path, 'rb') as f:
+        header = read_recording_header(f)
+        dtype = np.dtype(header['dtype'])
+        n_channels = len(header['channel_names'])
+
+        while True:
+            block_header = f.read(_BLOCK_HEADER.size)
+            if len(block_header) < _BLOCK_HEADER.size:
+                return
+            kind, n = _BLOCK_HEADER.unpack(block_header)
+
+            timestamps = np.frombuffer(f.read(8 * n), dtype=np.float64)
+            if len(timestamps) < n:
+                return
+
+            if kind == DATA_BLOCK:
+                size = dtype.itemsize * n * n_channels
+                buffer = f.read(size)
+                if len(buffer) < size:
+                    return
+                samples = np.frombuffer(buffer, dtype=dtype) \
+                    .reshape((n, n_channels), order='F')
+                yield kind, timestamps, samples
+            else:
+                length_bytes = f.read(_LENGTH.size)
+                if len(length_bytes) < _LENGTH.size:
+                    return
+                length, = _LENGTH.unpack(length_bytes)
+                encoded = f.read(length)
+                if len(encoded) < length:
+                    return
+                yield kind, timestamps, json.loads(encoded.decode())
+
+
+def read_recording(path):
+    """
+    Reads a whole recording file into a Session
+
+    :param path: path of the recording file
+    :return: Session
+    """
+    with open(path, 'rb') as f:
+        header = read_recording_header(f)
+
+    n_channels = len(header['channel_names'])
+    timestamps, samples = [np.empty(0)], \
+        [np.empty((0, n_channels), dtype=header['dtype'])]
+    marker_timestamps, marker_labels = [], []
+    for kind, block_timestamps, payload in iter_recording(path):
+        if kind == DATA_BLOCK:
+            timestamps.append(block_timestamps)
+            samples.append(payload)
+        else:
+            marker_timestamps.extend(block_timestamps.tolist())
+            marker_labels.extend(payload)
+
+    # markers are queued as they happen, not necessarily in time order
+    order = np.argsort(marker_timestamps, kind='stable')
+    return Session(np.concatenate(timestamps), np.concatenate(samples),
+                   header['channel_names'],
+                   sample_rate=header['sample_rate'],
+                   marker_timestamps=np.asarray(marker_timestamps)[order],
+                   marker_labels=[marker_labels[i] for i in order],
+                   stream_type=header['stream_type'] or 'EEG')
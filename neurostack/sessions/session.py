@@ -0,0 +1,165 @@
+"""
+A recorded session: the frames of one stream with their timestamps, and the
+markers (event labels with timestamps) that were sent during the recording.
+
+Readers of session files (EDFReader, XDFReader) have the same channel_names,
+sample_rate, stream_type, marker_timestamps, marker_labels and iter_chunks,
+so they can be replayed without loading the file into memory.
+"""
+import numpy as np
+
+
+def rechunk(chunks, chunk_size):
+    """
+    Regroups blocks of frames into blocks of chunk_size frames (the last one
+    may be shorter)
+
+    :param chunks: iterator of (timestamps, data) of shape (n,) and
+                   (n, channels)
+    :param chunk_size: number of frames per block
+    :return: iterator of (timestamps, data)
+    """
+    timestamps, data = [], []
+    n = 0
+    for chunk_timestamps, chunk_data in chunks:
+        timestamps.append(chunk_timestamps)
+        data.append(chunk_data)
+        n += len(chunk_timestamps)
+
+        if n < chunk_size:
+            continue
+        timestamps = np.concatenate(timestamps)
+        data = np.concatenate(data)
+        for start in range(0, n - chunk_size + 1, chunk_size):
+            yield timestamps[start:start + chunk_size], \
+                data[start:start + chunk_size]
+        rest = n - n % chunk_size
+        timestamps, data = [timestamps[rest:]], [data[rest:]]
+        n -= rest
+
+    if n > 0:
+        yield np.concatenate(timestamps), np.concatenate(data)
+
+
+class Session:
+
+    def __init__(self, timestamps, data, channel_names, sample_rate=0.,
+                 marker_timestamps=(), marker_labels=(), stream_type='EEG'):
+        """
+        :param timestamps: array of frame timestamps of shape (n,), in order
+        :param data: array of frames of shape (n, channels)
+        :param channel_names: list of channel names, one per column of data
+        :param sample_rate: nominal sample rate, or 0 for an irregular stream
+        :param marker_timestamps: timestamps of the markers, in order
+        :param marker_labels: labels of the markers
+        :param stream_type: LSL type of the recorded stream
+        """
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.data = np.asarray(data)
+        self.channel_names = list(channel_names)
+        self.sample_rate = float(sample_rate)
+        self.marker_timestamps = np.asarray(marker_timestamps,
+                                            dtype=np.float64)
+        self.marker_labels = [str(label) for label in marker_labels]
+        self.stream_type = stream_type
+
+        if self.data.ndim != 2 or \
+                self.data.shape != (len(self.timestamps),
+                                    len(self.channel_names)):
+            raise ValueError("Expected data of shape (timestamps, channels)")
+        if len(self.marker_timestamps) != len(self.marker_labels):
+            raise ValueError("Expected a timestamp for every marker")
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def duration(self):
+        """Number of seconds between the first and the last frame"""
+        if len(self.timestamps) == 0:
+            return 0.
+        return float(self.timestamps[-1] - self.timestamps[0])
+
+    def iter_chunks(self, chunk_size):
+        """
+        Iterates over the frames in chunks, without copying
+
+        :param chunk_size: maximum number of frames per chunk
+        :return: iterator of (timestamps, data) of shape (n,) and
+                 (n, channels)
+        """
+        for start in range(0, len(self.timestamps), chunk_size):
+            end = start + chunk_size
+            yield self.timestamps[start:end], self.data[start:end]
+
+    def markers_between(self, start_time, end_time):
+        """
+        Returns the markers with start_time <= timestamp < end_time
+
+        :return: list of (timestamp, label)
+        """
+        start, end = np.searchsorted(self.marker_timestamps,
+                                     [start_time, end_time])
+        return [(float(self.marker_timestamps[i]), self.marker_labels[i])
+                for i in range(start, end)]
+
+    #
+    # Saving and loading
+    #
+
+    def save(self, path):
+        """
+        Saves the session to a .npz file
+
+        :param path: path of the file
+        :return: None
+        """
+        np.savez(path, timestamps=self.timestamps, data=self.data,
+                 channel_names=np.array(self.channel_names, dtype=str),
+                 sample_rate=self.sample_rate,
+                 marker_timestamps=self.marker_timestamps,
+                 marker_labels=np.array(self.marker_labels, dtype=str),
+                 stream_type=self.stream_type)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a session saved with save
+
+        :param path: path of the file
+        :return: Session
+        """
+        with np.load(path, allow_pickle=False) as f:
+            return cls(f['timestamps'], f['data'], f['channel_names'].tolist(),
+                       sample_rate=float(f['sample_rate']),
+                       marker_timestamps=f['marker_timestamps'],
+                       marker_labels=f['marker_labels'].tolist(),
+                       stream_type=str(f['stream_type']))
+
+    @classmethod
+    def from_data_stream(cls, data_stream, channels=None, start_time=None,
+                         end_time=None, markers=()):
+        """
+        Copies the frames of a data stream into a session
+
+        :param data_stream: DataStream to copy from
+        :param channels: list of channels to copy. If None, all channels.
+        :param start_time: timestamp of the first frame. If None, the oldest
+                           frame.
+        :param end_time: timestamp after the last frame (exclusive). If None,
+                         up to the newest frame.
+        :param markers: list of (timestamp, label)
+        :return: Session
+        """
+        channels = data_stream.list_channels() if channels is None \
+            else channels
+        start, end = data_stream._index_range(start_time, end_time)
+        timestamps, data = data_stream._read(start, end)
+        data = data[:, [data_stream.channels[channel] for channel in channels]]
+
+        markers = sorted(markers)
+        return cls(timestamps, data, channels,
+                   sample_rate=data_stream.sample_rate,
+                   marker_timestamps=[t for t, _ in markers],
+                   marker_labels=[label for _, label in markers],
+                   stream_type=data_stream.stream_type or 'EEG')
@@ -0,0 +1,458 @@
+"""
+Streaming XDF import and export. Files are written one chunk of samples at a
+time. Reading scans the file once for stream headers, markers, clock offsets
+and the positions of sample chunks, then reads samples chunk by chunk when
+they are needed, so hours of data convert in constant memory.
+
+XDF files are a magic string followed by chunks of
+[number of length bytes][length][tag][content], see
+https://github.com/sccn/xdf/wiki/Specifications
+"""
+import struct
+import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from sessions.session import rechunk
+
+XDF_MAGIC = b'XDF:'
+
+FILE_HEADER = 1
+STREAM_HEADER = 2
+SAMPLES = 3
+CLOCK_OFFSET = 4
+BOUNDARY = 5
+STREAM_FOOTER = 6
+
+XDF_DTYPES = {
+    'float32': np.dtype('<f4'),
+    'double64': np.dtype('<f8'),
+    'int8': np.dtype('<i1'),
+    'int16': np.dtype('<i2'),
+    'int32': np.dtype('<i4'),
+    'int64': np.dtype('<i8'),
+}
+
+
+def _varlen(n):
+    """Encodes a length as XDF's [number of length bytes][length]"""
+    if n < 256:
+        return struct.pack('<BB', 1, n)
+    if n < 2 ** 32:
+        return struct.pack('<BI', 4, n)
+    return struct.pack('<BQ', 8, n)
+
+
+def _read_varlen(f):
+    """Reads a length written by _varlen, or returns None at end of file"""
+    size = f.read(1)
+    if not size:
+        return None
+    fmt = {1: '<B', 4: '<I', 8: '<Q'}[size[0]]
+    data = f.read(struct.calcsize(fmt))
+    if len(data) < struct.calcsize(fmt):
+        return None
+    return struct.unpack(fmt, data)[0]
+
+
+def _varlen_from(buffer, position):
+    """Decodes a length written by _varlen from a buffer"""
+    fmt = {1: '<B', 4: '<I', 8: '<Q'}[buffer[position]]
+    return struct.unpack_from(fmt, buffer, position + 1)[0], \
+        position + 1 + struct.calcsize(fmt)
+
+
+class XDFWriter:
+
+    def __init__(self, path, channel_names, sample_rate, stream_type='EEG',
+                 name='Neurostack', dtype=np.float32):
+        """
+        Creates an XDF file with a stream for the frames and a stream for
+        markers. Write frames with write, then call close.
+
+        :param path: path of the file, which is overwritten
+        :param channel_names: list of channel names
+        :param sample_rate: nominal sample rate, or 0 for an irregular stream
+        :param stream_type: LSL type of the stream
+        :param name: name of the stream
+        :param dtype: dtype the samples are stored as, one of XDF_DTYPES
+        """
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        formats = {xdf_dtype: xdf_format
+                   for xdf_format, xdf_dtype in XDF_DTYPES.items()}
+        if self.dtype not in formats:
+            raise ValueError(f"XDF can't store samples of dtype {self.dtype}")
+
+        self.channel_names = list(channel_names)
+        self._sample_dtype = np.dtype([
+            ('timestamp_bytes', 'u1'), ('timestamp', '<f8'),
+            ('values', self.dtype, (len(self.channel_names),))])
+
+        # [first timestamp, last timestamp, sample count] of each stream
+        self._footers = {1: [None, None, 0], 2: [None, None, 0]}
+
+        self._file = open(path, 'wb')
+        self._file.write(XDF_MAGIC)
+        self._write_chunk(FILE_HEADER, b'<?xml version="1.0"?>'
+                                       b'<info><version>1.0</version></info>')
+
+        channels = ''.join(
+            f"<channel><label>{escape(channel)}</label></channel>"
+            for channel in self.channel_names)
+        name = escape(name)
+        self._write_stream_header(
+            1, f"<name>{name}</name><type>{escape(stream_type)}</type>"
+               f"<channel_count>{len(self.channel_names)}</channel_count>"
+               f"<nominal_srate>{sample_rate}</nominal_srate>"
+               f"<channel_format>{formats[self.dtype]}</channel_format>"
+               f"<desc><channels>{channels}</channels></desc>")
+        self._write_stream_header(
+            2, f"<name>{name} Markers</name><type>Markers</type>"
+               f"<channel_count>1</channel_count>"
+               f"<nominal_srate>0</nominal_srate>"
+               f"<channel_format>string</channel_format>")
+
+    def _write_chunk(self, tag, content):
+        self._file.write(_varlen(len(content) + 2))
+        self._file.write(struct.pack('<H', tag))
+        self._file.write(content)
+
+    def _write_stream_header(self, stream_id, info):
+        self._write_chunk(STREAM_HEADER, struct.pack('<I', stream_id) +
+                          f'<?xml version="1.0"?><info>{info}</info>'.encode())
+
+    def _count(self, stream_id, timestamps):
+        footer = self._footers[stream_id]
+        if footer[0] is None:
+            footer[0] = float(timestamps[0])
+        footer[1] = float(timestamps[-1])
+        footer[2] += len(timestamps)
+
+    def write(self, timestamps, samples):
+        """
+        Writes frames as one chunk, with the timestamp of every frame
+
+        :param timestamps: array of shape (n,)
+        :param samples: array of shape (n, channels)
+        :return: None
+        """
+        n = len(timestamps)
+        if n == 0:
+            return
+
+        records = np.empty(n, dtype=self._sample_dtype)
+        records['timestamp_bytes'] = 8
+        records['timestamp'] = timestamps
+        records['values'] = samples
+
+        self._write_chunk(SAMPLES, struct.pack('<IBI', 1, 4, n) +
+                          records.tobytes())
+        self._count(1, timestamps)
+
+    def add_marker(self, timestamp, label):
+        """
+        Writes a marker
+
+        :param timestamp: timestamp of the marker, on the frames' clock
+        :param label: label of the marker
+        :return: None
+        """
+        encoded = str(label).encode('utf-8')
+        self._write_chunk(SAMPLES, struct.pack('<IBIBd', 2, 4, 1, 8,
+                                               timestamp) +
+                          _varlen(len(encoded)) + encoded)
+        self._count(2, [timestamp])
+
+    def close(self):
+        """Writes the stream footers and closes the file"""
+        for stream_id, (first, last, count) in self._footers.items():
+            if count == 0:
+                first = last = 0.
+            self._write_chunk(
+                STREAM_FOOTER, struct.pack('<I', stream_id) +
+                f'<?xml version="1.0"?><info>'
+                f'<first_timestamp>{first!r}</first_timestamp>'
+                f'<last_timestamp>{last!r}</last_timestamp>'
+                f'<sample_count>{count}</sample_count>'
+                f'</info>'.encode())
+        self._file.close()
+
+
+class _StreamHeader:
+    """Properties of one stream of an XDF file"""
+
+    def __init__(self, xml):
+        info = ElementTree.fromstring(xml)
+        self.name = info.findtext('name', '')
+        self.type = info.findtext('type', '')
+        self.channel_count = int(info.findtext('channel_count', '0'))
+        self.sample_rate = float(info.findtext('nominal_srate', '0'))
+        self.channel_format = info.findtext('channel_format', 'float32')
+
+        labels = [channel.findtext('label', '')
+                  for channel in info.iter('channel')]
+        self.channel_names = [label if label else f"{self.type}{i}"
+                              for i, label in enumerate(
+                                  labels[:self.channel_count] +
+                                  [''] * (self.channel_count - len(labels)))]
+
+        # (collection time, offset) measurements of the stream's clock
+        self.clock_times = []
+        self.clock_offsets = []
+
+
+class XDFReader:
+
+    def __init__(self, path, stream_type='EEG', name=None,
+                 synchronize_clocks=True):
+        """
+        Opens an XDF file and selects one numeric stream to read. Markers are
+        taken from all streams with string samples.
+
+        A reader can be replayed like a Session.
+
+        :param path: path of the file
+        :param stream_type: type of the stream to read
+        :param name: name of the stream to read. If None, the first stream of
+                     stream_type.
+        :param synchronize_clocks: if True, correct timestamps with the clock
+                                   offsets stored in the file
+        """
+        self.path = path
+        self.synchronize_clocks = synchronize_clocks
+
+        self._headers = {}
+        self._stream_id = None
+
+        # (content position, content length, timestamp before the chunk) of
+        # the selected stream's sample chunks
+        self._chunks = []
+        self._n_samples = 0
+        self._last_timestamp = 0.
+
+        markers = []
+        with open(path, 'rb') as f:
+            if f.read(len(XDF_MAGIC)) != XDF_MAGIC:
+                raise ValueError("Not an XDF file")
+
+            while True:
+                length = _read_varlen(f)
+                if length is None:
+                    break
+                tag_bytes = f.read(2)
+                if len(tag_bytes) < 2:
+                    break
+                tag, = struct.unpack('<H', tag_bytes)
+                position = f.tell()
+                content_length = length - 2
+
+                if tag == STREAM_HEADER:
+                    content = f.read(content_length)
+                    stream_id, = struct.unpack_from('<I', content)
+                    header = _StreamHeader(content[4:])
+                    self._headers[stream_id] = header
+                    if self._stream_id is None and \
+                            header.channel_format in XDF_DTYPES and \
+                            header.type == stream_type and \
+                            (name is None or header.name == name):
+                        self._stream_id = stream_id
+                elif tag == SAMPLES:
+                    stream_id, = struct.unpack('<I', f.read(4))
+                    header = self._headers.get(stream_id)
+                    if stream_id == self._stream_id:
+                        self._index_chunk(f, position, content_length)
+                    elif header is not None and \
+                            header.channel_format == 'string':
+                        content = f.read(content_length - 4)
+                        for timestamp, values in self._parse_strings(
+                                content, header):
+                            markers.append((stream_id, timestamp, values[0]))
+                elif tag == CLOCK_OFFSET:
+                    stream_id, time, offset = struct.unpack(
+                        '<Idd', f.read(20))
+                    if stream_id in self._headers:
+                        self._headers[stream_id].clock_times.append(time)
+                        self._headers[stream_id].clock_offsets.append(offset)
+
+                f.seek(position + content_length)
+
+        if self._stream_id is None:
+            raise ValueError(f"No numeric {stream_type} stream in {path}")
+
+        header = self._headers[self._stream_id]
+        self.channel_names = header.channel_names
+        self.sample_rate = header.sample_rate
+        self.stream_type = header.type
+        self._dtype = XDF_DTYPES[header.channel_format]
+
+        timestamps = np.array([self._synchronize(stream_id, timestamp)
+                               for stream_id, timestamp, _ in markers])
+        order = np.argsort(timestamps, kind='stable')
+        self.marker_timestamps = timestamps[order] if len(markers) \
+            else np.empty(0)
+        self.marker_labels = [markers[i][2] for i in order]
+
+    def _synchronize(self, stream_id, timestamps):
+        """Corrects timestamps with the clock offsets of their stream"""
+        header = self._headers[stream_id]
+        if not self.synchronize_clocks or not header.clock_times:
+            return timestamps
+        return timestamps + np.interp(timestamps, header.clock_times,
+                                      header.clock_offsets)
+
+    def _index_chunk(self, f, position, content_length):
+        """Remembers where a sample chunk of the selected stream is"""
+        content = f.read(content_length - 4)
+        timestamps, _ = self._parse_numeric(content, self._last_timestamp)
+        self._chunks.append((position, content_length, self._last_timestamp))
+        self._n_samples += len(timestamps)
+        if len(timestamps):
+            self._last_timestamp = timestamps[-1]
+
+    def _parse_numeric(self, content, previous):
+        """
+        Parses the samples of a numeric chunk
+
+        :param content: chunk content after the stream id
+        :param previous: timestamp of the sample before the chunk, for
+                         samples whose timestamp is left out
+        :return: (timestamps, data) arrays of shape (n,) and (n, channels)
+        """
+        header = self._headers[self._stream_id]
+        dtype = XDF_DTYPES[header.channel_format]
+        n, position = _varlen_from(content, 0)
+
+        # usually every sample has a timestamp, and all parse at once
+        sample_dtype = np.dtype([
+            ('timestamp_bytes', 'u1'), ('timestamp', '<f8'),
+            ('values', dtype, (header.channel_count,))])
+        if len(content) - position == n * sample_dtype.itemsize:
+            records = np.frombuffer(content, dtype=sample_dtype, count=n,
+                                    offset=position)
+            if np.all(records['timestamp_bytes'] == 8):
+                return records['timestamp'].copy(), records['values']
+
+        timestamps = np.empty(n)
+        data = np.empty((n, header.channel_count), dtype=dtype)
+        values_size = dtype.itemsize * header.channel_count
+        step = 1 / header.sample_rate if header.sample_rate > 0 else 0.
+        for i in range(n):
+            if content[position] == 8:
+                previous, = struct.unpack_from('<d', content, position + 1)
+                position += 9
+            else:
+                previous += step
+                position += 1
+            timestamps[i] = previous
+            data[i] = np.frombuffer(content, dtype=dtype,
+                                    count=header.channel_count,
+                                    offset=position)
+            position += values_size
+        return timestamps, data
+
+    @staticmethod
+    def _parse_strings(content, header):
+        """Parses the samples of a string chunk into (timestamp, values)"""
+        n, position = _varlen_from(content, 0)
+        step = 1 / header.sample_rate if header.sample_rate > 0 else 0.
+        previous = 0.
+        samples = []
+        for _ in range(n):
+            if content[position] == 8:
+                previous, = struct.unpack_from('<d', content, position + 1)
+                position += 9
+            else:
+                previous += step
+                position += 1
+            values = []
+            for _ in range(header.channel_count):
+                length, position = _varlen_from(content, position)
+                values.append(content[position:position + length]
+                              .decode('utf-8'))
+                position += length
+            samples.append((previous, values))
+        return samples
+
+    def __len__(self):
+        return self._n_samples
+
+    @property
+    def duration(self):
+        """Number of seconds between the first and the last frame"""
+        first = next(self.iter_chunks(1), None)
+        if first is None:
+            return 0.
+        return float(self._synchronize(self._stream_id,
+                                       self._last_timestamp) - first[0][0])
+
+    def iter_chunks(self, chunk_size):
+        """
+        Iterates over the frames in chunks, reading one XDF chunk at a time
+
+        :param chunk_size: maximum number of frames per chunk
+        :return: iterator of (timestamps, data)
+        """
+        def blocks():
+            with open(self.path, 'rb') as f:
+                for position, content_length, previous in self._chunks:
+                    f.seek(position + 4)
+                    timestamps, data = self._parse_numeric(
+                        f.read(content_length - 4), previous)
+                    yield self._synchronize(self._stream_id, timestamps), data
+
+        return rechunk(blocks(), chunk_size)
+
+
+def write_xdf(path, chunks, channel_names, sample_rate, markers=(),
+              **options):
+    """
+    Writes frames to an XDF file, one block at a time
+
+    :param path: path of the file
+    :param chunks: iterator of (timestamps, data) of shape (n,) and
+                   (n, channels)
+    :param channel_names: list of channel names
+    :param sample_rate: nominal sample rate of the frames
+    :param markers: list of (timestamp, label)
+    :param options: more arguments for XDFWriter
+    :return: number of frames written
+    """
+    writer = XDFWriter(path, channel_names, sample_rate, **options)
+    n_frames = 0
+    for timestamps, data in chunks:
+        writer.write(timestamps, data)
+        n_frames += len(timestamps)
+    for timestamp, label in markers:
+        writer.add_marker(timestamp, label)
+    writer.close()
+    return n_frames
+
+
+def export_xdf(data_stream, path, channels=None, start_time=None,
+               end_time=None, markers=None, chunk_size=4096, **options):
+    """
+    Exports a time slice of a data stream to an XDF file in constant memory,
+    keeping the timestamp of every frame
+
+    :param data_stream: DataStream to export
+    :param path: path of the file
+    :param channels: list of channels to export. If None, all channels.
+    :param start_time: start time. If None, start from the oldest data.
+    :param end_time: time to stop at (exclusive). If None, stop at the newest
+                     frame.
+    :param markers: list of (timestamp, label) in the stream's time. If None,
+                    the stream's own markers between start_time and end_time.
+    :param chunk_size: number of frames per XDF chunk
+    :param options: more arguments for XDFWriter
+    :return: number of frames written
+    """
+    channels = data_stream.list_channels() if channels is None else channels
+    if markers is None:
+        markers = list(zip(*data_stream.get_markers(start_time, end_time)))
+    options.setdefault('stream_type', data_stream.stream_type or 'EEG')
+    return write_xdf(path,
+                     data_stream.iter_chunks(channels, start_time, end_time,
+                                             chunk_size),
+                     channels, data_stream.sample_rate, markers=markers,
+                     **options)
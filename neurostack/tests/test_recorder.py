@@ -0,0 +1,29 @@
+import numpy as np
+
+from data_streams.data_stream import DataStream
+from sessions.recorder import Recorder, read_recording
+
+
+def test_add_data_frames_are_recorded_complete(tmp_path):
+    stream = DataStream()
+    stream.add_channel('a')
+    stream.add_channel('b')
+    cursor = stream.subscribe()
+
+    path = str(tmp_path / 'recording.bin')
+    recorder = Recorder(stream, path)
+    recorder.start()
+    for i in range(50):
+        stream.add_data('a', [i / 100, i])
+
+        # a frame is not published before every channel has a value
+        timestamps, data = cursor.read()
+        assert not np.isnan(data).any()
+
+        stream.add_data('b', [i / 100, -i])
+    recorder.stop()
+
+    session = read_recording(path)
+    expected = np.stack([np.arange(50), -np.arange(50)], axis=1)
+    np.testing.assert_array_equal(session.data, expected)
+    np.testing.assert_allclose(session.timestamps, np.arange(50) / 100)
@@ -1,3 +1,5 @@
+import concurrent.futures
+import threading
 import uuid
 
 
@@ -6,3 +8,34 @@ def generate_uuid():
     # Completely random UUID; use uuid1() for a UUID based on host MAC address
     # and current time
     return str(uuid.uuid4())
+
+
+def resolved_future(result=None):
+    """Returns a concurrent.futures.Future that is already resolved"""
+    future = concurrent.futures.Future()
+    future.set_result(result)
+    return future
+
+
+def run_in_background(function, *args):
+    """
+    Runs function(*args) in a daemon thread
+
+    :return: concurrent.futures.Future that resolves to the function's return
+             value
+    """
+    future = concurrent.futures.Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    thread = threading.Thread(target=run, name=function.__name__)
+    thread.daemon = True
+    thread.start()
+
+    return future